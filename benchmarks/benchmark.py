@@ -0,0 +1,335 @@
+"""
+Нагрузочный бенчмарк TechMart API.
+
+Генерирует синтетических пользователей, категории и товары в заданном масштабе
+во временной папке, поднимает приложение в том же процессе и гоняет все эндпоинты
+через httpx.ASGITransport несколькими параллельными клиентами (сеть не нужна).
+Результат - JSON с пропускной способностью и p50/p95/p99 по каждому эндпоинту;
+его можно сравнить с сохраненным базовым прогоном и найти регрессии.
+
+Запуск из корня проекта:
+    python -m benchmarks.benchmark --scale 1k --output bench.json
+    python -m benchmarks.benchmark --scale 1k --save-baseline      # обновить baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+BENCH_PASSWORD = "bench-password"
+# Остаток товаров достаточно большой, чтобы покупки в бенчмарке не упирались в ноль
+STOCK_QUANTITY = 1_000_000
+
+# --- Синтетические данные ---
+def parse_scale(value: str) -> int:
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неизвестный масштаб {value!r}: ожидается {', '.join(SCALES)} или число")
+
+def dataset_sizes(products: int) -> Dict[str, int]:
+    return {
+        "products": products,
+        "users": max(10, products // 10),
+        "categories": max(5, products // 1000),
+    }
+
+def _write_json_array(path: str, records: Iterable[Dict[str, Any]]):
+    # Пишем по одной записи, чтобы не держать в памяти весь миллион товаров
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, record in enumerate(records):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(record, ensure_ascii=False))
+        f.write("]")
+
+def generate_dataset(work_dir: str, sizes: Dict[str, int], hashed_password: str, seed: int):
+    """Создает database/*.json в work_dir. Пользователи: a1, w1 и покупатели c1..cN."""
+    rng = random.Random(seed)
+    database_dir = os.path.join(work_dir, "database")
+    os.makedirs(database_dir, exist_ok=True)
+    categories = [f"Category {i}" for i in range(1, sizes["categories"] + 1)]
+    words = ["phone", "laptop", "tablet", "camera", "speaker", "monitor", "router", "watch", "drone", "console"]
+
+    def users():
+        yield {"id": "a1", "username": "bench-admin", "role": "admin", "hashed_password": hashed_password}
+        yield {"id": "w1", "username": "bench-worker", "role": "worker", "hashed_password": hashed_password}
+        for i in range(1, sizes["users"] - 1):
+            yield {"id": f"c{i}", "username": f"bench-customer-{i}", "role": "customer", "hashed_password": hashed_password}
+
+    def products():
+        for i in range(1, sizes["products"] + 1):
+            yield {
+                "id": f"p{i}",
+                "name": f"{rng.choice(words).title()} {i}",
+                "description": f"{rng.choice(words)} {rng.choice(words)} model {i % 97}",
+                "price": round(rng.uniform(1, 5000), 2),
+                "category": rng.choice(categories),
+                "quantity": STOCK_QUANTITY,
+            }
+
+    _write_json_array(os.path.join(database_dir, "users.json"), users())
+    _write_json_array(os.path.join(database_dir, "categories.json"), ({"name": name} for name in categories))
+    _write_json_array(os.path.join(database_dir, "products.json"), products())
+
+# --- Сценарии ---
+@dataclass
+class Scenario:
+    """Один эндпоинт: build(i) возвращает аргументы i-го запроса для httpx (url, json, data, params)."""
+    name: str
+    method: str
+    role: Optional[str]
+    build: Callable[[int], Dict[str, Any]]
+    requests: int
+    expected: Tuple[int, ...] = (200,)
+
+def build_scenarios(sizes: Dict[str, int], requests: int, auth_requests: int, run_id: str) -> List[Scenario]:
+    """Сценарии по всем роутерам. Порядок важен: сначала чтение, потом изменения, в конце удаления."""
+    products = sizes["products"]
+    customers = sizes["users"] - 2
+    categories = sizes["categories"]
+    rng = random.Random(products)
+    product_id = lambda i: f"p{rng.randint(1, products)}"
+    customer_id = lambda i: f"c{rng.randint(1, customers)}"
+    new_product = lambda i: {
+        "name": f"Bench product {i}", "description": "benchmark", "price": 10.0 + i,
+        "category": f"Category {i % categories + 1}", "quantity": STOCK_QUANTITY,
+    }
+    return [
+        # auth
+        Scenario("POST /api/customer-reg", "POST", None,
+                 lambda i: {"url": "/api/customer-reg", "json": {"username": f"bench-{run_id}-{i}", "password": BENCH_PASSWORD}},
+                 auth_requests, (201,)),
+        Scenario("POST /api/token", "POST", None,
+                 lambda i: {"url": "/api/token", "data": {"username": "bench-worker", "password": BENCH_PASSWORD}},
+                 auth_requests),
+        # users
+        Scenario("GET /api/user/", "GET", "admin", lambda i: {"url": "/api/user/"}, max(1, requests // 10)),
+        Scenario("GET /api/user/{user_id}", "GET", "worker", lambda i: {"url": f"/api/user/{customer_id(i)}"}, requests),
+        Scenario("POST /api/user/search", "POST", "worker",
+                 lambda i: {"url": "/api/user/search", "json": {"username": f"customer-{rng.randint(1, 99)}"}}, requests),
+        # products: чтение
+        Scenario("GET /api/products/category/", "GET", "customer", lambda i: {"url": "/api/products/category/"}, requests),
+        Scenario("GET /api/products/category/{category_name}", "GET", "customer",
+                 lambda i: {"url": f"/api/products/category/Category {rng.randint(1, categories)}", "params": {"limit": 100}},
+                 requests),
+        Scenario("GET /api/products/", "GET", "customer",
+                 lambda i: {"url": "/api/products/", "params": {"limit": 100, "offset": rng.randint(0, max(0, products - 100))}},
+                 requests),
+        Scenario("GET /api/products/?sort=price", "GET", "customer",
+                 lambda i: {"url": "/api/products/", "params": {"limit": 100, "sort": "price"}}, max(1, requests // 10)),
+        # Разные пороги, чтобы мерить сам векторный проход, а не только кэш ответов
+        Scenario("GET /api/products/stats", "GET", "worker",
+                 lambda i: {"url": "/api/products/stats", "params": {"low_stock_threshold": i}}, max(1, requests // 10)),
+        Scenario("GET /api/products/{product_id}", "GET", "customer", lambda i: {"url": f"/api/products/{product_id(i)}"}, requests),
+        Scenario("POST /api/products/search", "POST", "customer",
+                 lambda i: {"url": "/api/products/search", "params": {"limit": 100},
+                            "json": {"search": rng.choice(["phone", "lap", "camera model", "drone"]),
+                                     "min_price": 100, "max_price": 2000}},
+                 requests),
+        # products: изменения
+        Scenario("POST /api/products/category/", "POST", "worker",
+                 lambda i: {"url": "/api/products/category/", "json": {"name": f"Bench {run_id} {i}"}}, requests, (201,)),
+        Scenario("POST /api/products/", "POST", "worker", lambda i: {"url": "/api/products/", "json": new_product(i)},
+                 requests, (201,)),
+        Scenario("POST /api/products/bulk", "POST", "worker",
+                 lambda i: {"url": "/api/products/bulk",
+                            "json": {"create": [new_product(i * 100 + j) for j in range(100)],
+                                     "update": [{"id": product_id(i), "price": 99.0}]}},
+                 max(1, requests // 10)),
+        Scenario("PUT /api/products/{product_id}/update-quantity", "PUT", "worker",
+                 lambda i: {"url": f"/api/products/{product_id(i)}/update-quantity", "json": {"change": 1}}, requests),
+        Scenario("POST /api/products/{product_id}/purchase", "POST", "customer",
+                 lambda i: {"url": f"/api/products/{product_id(i)}/purchase", "json": {"quantity": 1}}, requests),
+        Scenario("POST /api/cart/checkout", "POST", "customer",
+                 lambda i: {"url": "/api/cart/checkout",
+                            "json": {"items": [{"product_id": product_id(i), "quantity": 1} for _ in range(20)]}},
+                 requests),
+        Scenario("PATCH /api/products/{product_id}", "PATCH", "worker",
+                 lambda i: {"url": f"/api/products/{product_id(i)}", "json": {"description": f"edited {i}"}}, requests),
+        Scenario("PATCH /api/products/{product_id}/form", "PATCH", "worker",
+                 lambda i: {"url": f"/api/products/{product_id(i)}/form", "data": {"price": str(20.0 + i)}}, requests),
+        # удаления: каждый запрос удаляет свою запись с конца диапазона
+        Scenario("DELETE /api/products/{product_id}", "DELETE", "worker",
+                 lambda i: {"url": f"/api/products/p{products - i}"}, min(requests, products // 2), (204,)),
+        Scenario("DELETE /api/delete-user/{user_id}", "DELETE", "admin",
+                 lambda i: {"url": f"/api/delete-user/c{customers - i}"}, min(requests, customers // 2), (204,)),
+    ]
+
+# --- Прогон ---
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def summarize(latencies: List[float], errors: int, wall_time: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / wall_time, 2) if wall_time > 0 else 0.0,
+        "mean_ms": to_ms(sum(values) / len(values)) if values else 0.0,
+        "p50_ms": to_ms(percentile(values, 50)),
+        "p95_ms": to_ms(percentile(values, 95)),
+        "p99_ms": to_ms(percentile(values, 99)),
+    }
+
+async def run_scenario(client, scenario: Scenario, tokens: Dict[str, Dict[str, str]], concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    indexes = iter(range(scenario.requests))
+
+    async def client_loop():
+        nonlocal errors
+        # Все клиенты берут номера запросов из общего итератора
+        for i in indexes:
+            request = scenario.build(i)
+            headers = tokens[scenario.role] if scenario.role else {}
+            start = time.perf_counter()
+            response = await client.request(scenario.method, headers=headers, **request)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code not in scenario.expected:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+async def run_benchmark(args: argparse.Namespace, sizes: Dict[str, int]) -> Dict[str, Any]:
+    import httpx
+    import main as app_module
+
+    await app_module.startup_event()
+    transport = httpx.ASGITransport(app=app_module.app)
+    results: Dict[str, Any] = {}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            tokens: Dict[str, Dict[str, str]] = {}
+            for role, username in (("admin", "bench-admin"), ("worker", "bench-worker"), ("customer", "bench-customer-1")):
+                response = await client.post("/api/token", data={"username": username, "password": BENCH_PASSWORD})
+                response.raise_for_status()
+                tokens[role] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            run_id = f"{int(time.time())}"
+            for scenario in build_scenarios(sizes, args.requests, args.auth_requests, run_id):
+                if args.only and not any(part in scenario.name for part in args.only):
+                    continue
+                results[scenario.name] = await run_scenario(client, scenario, tokens, args.concurrency)
+                print(f"{scenario.name:<50} {results[scenario.name]['throughput_rps']:>10.1f} rps  "
+                      f"p95 {results[scenario.name]['p95_ms']:>9.2f} ms", file=sys.stderr)
+    finally:
+        await app_module.shutdown_event()
+    return results
+
+# --- Сравнение с базовым прогоном ---
+def baseline_key(meta: Dict[str, Any]) -> str:
+    return f"{meta['engine']}:{meta['scale']}"
+
+def find_regressions(endpoints: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """
+    Эндпоинт считается регрессией, если p95 вырос больше чем на tolerance (и больше чем на min_delta_ms,
+    чтобы не реагировать на шум в долях миллисекунды) или пропускная способность упала больше чем на tolerance.
+    """
+    regressions = []
+    for name, current in endpoints.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {current['errors']} > baseline {base['errors']}")
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance) and current["p95_ms"] - base["p95_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms > baseline {base['p95_ms']} ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_rps']} rps < baseline {base['throughput_rps']} rps")
+    return regressions
+
+def load_baselines(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк эндпоинтов TechMart API на синтетических данных")
+    parser.add_argument("--scale", type=parse_scale, default=SCALES["1k"], help="число товаров: 1k, 100k, 1M или число")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на эндпоинт")
+    parser.add_argument("--auth-requests", type=int, default=20, help="запросов на эндпоинты с bcrypt (регистрация, вход)")
+    parser.add_argument("--concurrency", type=int, default=16, help="число параллельных клиентов")
+    parser.add_argument("--only", nargs="*", help="гонять только эндпоинты, в названии которых есть одна из строк")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="куда записать JSON-отчет (по умолчанию stdout)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл с базовыми прогонами")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить этот прогон как базовый")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="допустимое ухудшение (доля); записи с fsync заметно шумят")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="минимальный рост p95, который считается регрессией")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    sizes = dataset_sizes(args.scale)
+    scale_name = next((name for name, value in SCALES.items() if value == args.scale), str(args.scale))
+
+    # Пути из аргументов считаются от текущей папки, а не от временной
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline)
+
+    # Приложение работает с относительными путями database/*.json, поэтому запускаем его во временной папке
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    sys.path.insert(0, ROOT_DIR)
+    work_dir = tempfile.mkdtemp(prefix="techmart-bench-")
+    os.chdir(work_dir)
+
+    from security.security import get_password_hash
+    generate_dataset(work_dir, sizes, get_password_hash(BENCH_PASSWORD), args.seed)
+
+    endpoints = asyncio.run(run_benchmark(args, sizes))
+    meta = {
+        "scale": scale_name,
+        "sizes": sizes,
+        "engine": os.getenv("DB_ENGINE", "json"),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    report: Dict[str, Any] = {"meta": meta, "endpoints": endpoints}
+
+    baselines = load_baselines(baseline_path)
+    baseline = baselines.get(baseline_key(meta))
+    if args.save_baseline:
+        baselines[baseline_key(meta)] = report
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=4, ensure_ascii=False)
+    elif baseline is not None:
+        report["regressions"] = find_regressions(endpoints, baseline["endpoints"], args.tolerance, args.min_delta_ms)
+
+    output = json.dumps(report, indent=4, ensure_ascii=False)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for line in report.get("regressions", []):
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if report.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Колоночное представление каталога для аналитики склада: цены, остатки и коды категорий
+лежат в массивах NumPy, поэтому статистика по всему каталогу считается
+несколькими векторными операциями, без обхода моделей товаров.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from database.engine import category_key
+from models.models import MAX_QUANTITY, CategoryStats, InventoryStats, LowStockItem
+
+# Начальная емкость массивов; при заполнении она удваивается
+INITIAL_CAPACITY = 1024
+
+def _exact_sums(values: np.ndarray, starts: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Точные суммы неотрицательных int64: всего массива или отрезков, начинающихся в starts.
+    Сумма остатков до MAX_QUANTITY не помещается ни в int64, ни точно во float64, поэтому
+    старшие и младшие 32 бита складываются отдельно (каждая из сумм в int64 не переполняется)
+    и собираются в int Python.
+    """
+    high = values >> 32
+    low = values & 0xFFFFFFFF
+    if starts is None:
+        return [(int(high.sum()) << 32) + int(low.sum())]
+    return [(h << 32) + l for h, l in zip(np.add.reduceat(high, starts).tolist(), np.add.reduceat(low, starts).tolist())]
+
+class ProductColumns:
+    """
+    Колонки price, quantity и category (код категории) по слотам. Слот освобождается
+    при удалении товара (код категории становится -1) и занимается следующим добавленным,
+    так что изменение товара стоит O(1) и массивы не перестраиваются.
+    Интерфейс rebuild/add/remove тот же, что у индексов из database.indexes.
+    Категории сравниваются без учета регистра, как в HashIndex; имя категории в ответе -
+    написание у первого встреченного товара.
+    """
+
+    def __init__(self):
+        self.rebuild(())
+
+    def rebuild(self, items: Iterable[Tuple[str, BaseModel]]):
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._category_codes: Dict[str, int] = {}
+        self.category_names: List[str] = []
+        self.keys: List[Optional[str]] = []
+        self.names: List[Optional[str]] = []
+        prices: List[float] = []
+        quantities: List[int] = []
+        codes: List[int] = []
+        for key, item in items:
+            self._slots[key] = len(self.keys)
+            self.keys.append(key)
+            self.names.append(item.name)
+            prices.append(item.price)
+            # Остатки больше MAX_QUANTITY API не принимает, но они могли попасть в файл раньше:
+            # для статистики их хватит обрезать, а загрузка каталога из-за них падать не должна
+            quantities.append(min(item.quantity, MAX_QUANTITY))
+            codes.append(self._category_code(item.category))
+        capacity = max(INITIAL_CAPACITY, len(self.keys))
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.quantity = np.zeros(capacity, dtype=np.int64)
+        self.category = np.full(capacity, -1, dtype=np.int32)
+        self.price[:len(prices)] = prices
+        self.quantity[:len(quantities)] = quantities
+        self.category[:len(codes)] = codes
+
+    def _category_code(self, category: str) -> int:
+        folded = category_key(category)
+        code = self._category_codes.get(folded)
+        if code is None:
+            code = self._category_codes[folded] = len(self.category_names)
+            self.category_names.append(category)
+        return code
+
+    def _grow(self):
+        capacity = len(self.price) * 2
+        self.price = np.resize(self.price, capacity)
+        self.quantity = np.resize(self.quantity, capacity)
+        category = np.full(capacity, -1, dtype=np.int32)
+        category[:len(self.category)] = self.category
+        self.category = category
+
+    def add(self, key: str, item: BaseModel):
+        slot = self._free[-1] if self._free else len(self.keys)
+        if slot == len(self.price):
+            self._grow()
+        # Сначала числа: если значение не помещается в колонку (OverflowError), слот остается свободным
+        self.price[slot] = item.price
+        self.quantity[slot] = item.quantity
+        self.category[slot] = self._category_code(item.category)
+        if self._free:
+            self._free.pop()
+            self.keys[slot] = key
+            self.names[slot] = item.name
+        else:
+            self.keys.append(key)
+            self.names.append(item.name)
+        self._slots[key] = slot
+
+    def remove(self, key: str, item: BaseModel):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        self.category[slot] = -1
+        self.keys[slot] = None
+        self.names[slot] = None
+        self._free.append(slot)
+
+    def inventory_stats(self, low_stock_threshold: int, low_stock_limit: int) -> InventoryStats:
+        """
+        Статистика по живым слотам: число товаров, штук и стоимость остатков всего и по категориям,
+        минимальная, максимальная и медианная цена по категориям и товары с остатком
+        не больше low_stock_threshold (самые дефицитные первыми, не больше low_stock_limit).
+        """
+        used = len(self.keys)
+        live = np.flatnonzero(self.category[:used] >= 0)
+        price = self.price[live]
+        quantity = self.quantity[live]
+        category = self.category[live]
+        value = price * quantity
+
+        categories: List[CategoryStats] = []
+        if len(live):
+            # Сортировка по (категория, цена): у каждой категории непрерывный отрезок,
+            # минимум, максимум и медиана берутся по его границам и середине
+            order = np.lexsort((price, category))
+            sorted_price = price[order]
+            sorted_category = category[order]
+            starts = np.flatnonzero(np.r_[True, sorted_category[1:] != sorted_category[:-1]])
+            ends = np.r_[starts[1:], len(order)]
+            sizes = ends - starts
+            medians = (sorted_price[starts + (sizes - 1) // 2] + sorted_price[starts + sizes // 2]) / 2
+            codes = sorted_category[starts]
+            quantities = _exact_sums(quantity[order], starts)
+            value_by_code = np.bincount(category, weights=value, minlength=len(self.category_names))
+            for code, start, end, size, median, category_quantity in zip(
+                    codes.tolist(), starts.tolist(), ends.tolist(), sizes.tolist(), medians.tolist(), quantities):
+                categories.append(CategoryStats(
+                    category=self.category_names[code],
+                    products=size,
+                    quantity=category_quantity,
+                    inventory_value=float(value_by_code[code]),
+                    min_price=float(sorted_price[start]),
+                    max_price=float(sorted_price[end - 1]),
+                    median_price=median,
+                ))
+
+        low = np.flatnonzero(quantity <= low_stock_threshold)
+        # Самые дефицитные первыми; при равном остатке порядок стабилен (по слоту)
+        low = low[np.argsort(quantity[low], kind="stable")]
+        low_stock = [
+            LowStockItem(
+                id=self.keys[slot],
+                name=self.names[slot],
+                category=self.category_names[self.category[slot]],
+                quantity=int(self.quantity[slot]),
+            )
+            for slot in live[low[:low_stock_limit]].tolist()
+        ]
+        return InventoryStats(
+            products=len(live),
+            quantity=_exact_sums(quantity)[0],
+            inventory_value=float(value.sum()),
+            categories=categories,
+            low_stock_threshold=low_stock_threshold,
+            low_stock_count=len(low),
+            low_stock=low_stock,
+        )
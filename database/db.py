@@ -1,76 +1,226 @@
-import json
-from typing import List, Dict, Any, Optional
-from models.models import UserInDB, Product, Category
+import asyncio
+import os
+from concurrent.futures import Future
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+from models.models import MAX_QUANTITY, UserInDB, Product, Category, ProductSearch, InventoryStats
+# generate_new_id по-прежнему доступен из database.db
+from database.engine import RecordNotFound, StorageEngine, generate_new_id
+from database.json_engine import JsonStorageEngine
+from database.shared_state import SharedState
+from database.snapshot import get_snapshot_format, migrate_snapshot
+from database.sqlite_engine import SqliteStorageEngine
+
+load_dotenv()
 
 # Пути к файлам данных
 USERS_DB_PATH = "database/users.json"
 PRODUCTS_DB_PATH = "database/products.json"
 CATEGORIES_DB_PATH = "database/categories.json" 
+PRODUCTS_JOURNAL_PATH = "database/products.journal"
+SEQUENCES_DB_PATH = "database/sequences.json"
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "database/techmart.sqlite3")
+
+# Движок хранения: "json" (файлы выше) или "sqlite"
+DB_ENGINE = os.getenv("DB_ENGINE", "json")
+# Формат снапшотов файлового движка: "json" или "binary" (колоночный, файлы *.snap рядом с *.json).
+# При первом запуске с binary существующие JSON-файлы перекодируются автоматически; вручную:
+# python -m database.snapshot database/products.json database/products.snap
+DB_SNAPSHOT_FORMAT = os.getenv("DB_SNAPSHOT_FORMAT", "json")
+# Размер журнала товаров, после которого он сворачивается в снапшот products.json
+PRODUCTS_JOURNAL_COMPACT_BYTES = int(os.getenv("PRODUCTS_JOURNAL_COMPACT_BYTES", 1024 * 1024))
+# Сколько миллисекунд писатель коллекции копит изменения перед одной записью на диск
+GROUP_COMMIT_INTERVAL_MS = float(os.getenv("DB_GROUP_COMMIT_MS", 5))
+# Write-behind для остатков: покупки и правки количества не ждут диска, а пишутся
+# раз в STOCK_FLUSH_INTERVAL_MS или как только грязных товаров станет STOCK_FLUSH_MAX_DIRTY
+STOCK_WRITE_BEHIND = os.getenv("STOCK_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+STOCK_FLUSH_INTERVAL_MS = float(os.getenv("STOCK_FLUSH_INTERVAL_MS", 1000))
+STOCK_FLUSH_MAX_DIRTY = int(os.getenv("STOCK_FLUSH_MAX_DIRTY", 1000))
+# Файл общего состояния воркеров (лимиты запросов, инвалидации кэшей). Задается, когда uvicorn
+# запущен с несколькими воркерами; пустое значение - однопроцессный режим
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")
+# Остаток, начиная с которого (и ниже) товар попадает в список заканчивающихся в /api/products/stats
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", 5))
+
+# --- Выбор движка хранения ---
+def create_json_engine() -> JsonStorageEngine:
+    snapshot_format = get_snapshot_format(DB_SNAPSHOT_FORMAT)
+    return JsonStorageEngine(
+        users_path=migrate_snapshot(USERS_DB_PATH, snapshot_format),
+        products_path=migrate_snapshot(PRODUCTS_DB_PATH, snapshot_format),
+        categories_path=migrate_snapshot(CATEGORIES_DB_PATH, snapshot_format),
+        products_journal_path=PRODUCTS_JOURNAL_PATH,
+        sequences_path=SEQUENCES_DB_PATH,
+        journal_compact_bytes=PRODUCTS_JOURNAL_COMPACT_BYTES,
+        group_commit_ms=GROUP_COMMIT_INTERVAL_MS,
+        snapshot_format=snapshot_format,
+        write_behind_ms=STOCK_FLUSH_INTERVAL_MS,
+        write_behind_max_dirty=STOCK_FLUSH_MAX_DIRTY,
+    )
+
+def create_storage_engine(name: str) -> StorageEngine:
+    if name == "json":
+        if SHARED_STATE_PATH:
+            # Кэш JSON-движка и его групповой коммит принадлежат одному процессу: записи
+            # из нескольких воркеров затирали бы друг друга при перезаписи файлов
+            raise ValueError("Несколько воркеров (SHARED_STATE_PATH) поддерживаются только с DB_ENGINE=sqlite")
+        return create_json_engine()
+    if name == "sqlite":
+        # Новая база SQLite заполняется данными из JSON-файлов
+        return SqliteStorageEngine(SQLITE_DB_PATH, seed=create_json_engine)
+    raise ValueError(f"Неизвестный движок хранения DB_ENGINE={name!r}: ожидается json или sqlite")
 
-# --- Функции для работы с JSON ---
-def read_data(path: str) -> List[Dict[str, Any]]:
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+engine = create_storage_engine(DB_ENGINE)
+shared_state: Optional[SharedState] = SharedState(SHARED_STATE_PATH) if SHARED_STATE_PATH else None
 
-def write_data(path: str, data: List[Dict[str, Any]]):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Счетчики движка по каждой коллекции (для JSON - попадания/промахи кэша и групповой коммит)."""
+    return engine.stats()
 
 # --- Генерация ID ---
-def generate_new_id(prefix: str, items: List[Dict[str, Any]]) -> str:
-    """Генерирует новый ID с инкрементом."""
-    if not items:
-        return f"{prefix}1"
-    
-    max_id = 0
-    for item in items:
-        if item['id'].startswith(prefix):
-            try:
-                # Извлекаем числовую часть ID
-                num_part = int(item['id'][len(prefix):])
-                if num_part > max_id:
-                    max_id = num_part
-            except (ValueError, IndexError):
-                continue
-                
-    return f"{prefix}{max_id + 1}"
+def recover_id_sequences():
+    engine.recover_ids()
+
+def next_product_id() -> str:
+    return engine.allocate_ids("p")[0]
+
+def next_product_ids(count: int) -> List[str]:
+    return engine.allocate_ids("p", count)
+
+def next_user_id(prefix: str) -> str:
+    return engine.allocate_ids(prefix)[0]
+
+# --- Подтверждение записи ---
+# Функции, меняющие данные, возвращают Future. Изменение уже видно при чтении,
+# а Future завершится, когда движок запишет его на диск (у JSON - групповым коммитом).
+async def wait_for_commit(commit: Future):
+    await asyncio.wrap_future(commit)
+
+def flush_all_db():
+    """Синхронно записывает все накопленные изменения (например, при остановке сервера)."""
+    engine.flush()
+
+class InsufficientStock(Exception):
+    """Изменение остатка увело бы количество товара в минус."""
+
+    def __init__(self, available: int, product_id: Optional[str] = None):
+        super().__init__(f"Not enough items in stock. Available: {available}.")
+        self.available = available
+        self.product_id = product_id
+
+class QuantityLimitExceeded(Exception):
+    """Изменение остатка увело бы количество товара выше MAX_QUANTITY."""
 
 # --- Функции для пользователей ---
 def get_all_users_db() -> List[UserInDB]:
-    users_data = read_data(USERS_DB_PATH)
-    return [UserInDB(**user) for user in users_data]
+    return engine.users.load()
 
 def save_all_users_db(users: List[UserInDB]):
-    write_data(USERS_DB_PATH, [user.model_dump() for user in users])
+    engine.users.save(users)
+
+def users_version_db() -> str:
+    return engine.users.version()
 
 def find_user_by_username(username: str) -> Optional[UserInDB]:
-    users = get_all_users_db()
-    for user in users:
-        if user.username == username:
-            return user
-    return None
+    return engine.users.find_by("username", username)
 
 def find_user_by_id(user_id: str) -> Optional[UserInDB]:
-    users = get_all_users_db()
-    for user in users:
-        if user.id == user_id:
-            return user
-    return None
+    return engine.users.get(user_id)
+
+def add_user_db(user: UserInDB) -> Future:
+    return engine.users.insert(user)
+
+def delete_user_db(user_id: str) -> Optional[Future]:
+    return engine.users.delete(user_id)
 
 # --- Функции для товаров ---
-def get_all_products_db() -> List[Product]:
-    products_data = read_data(PRODUCTS_DB_PATH)
-    return [Product(**product) for product in products_data]
+def get_all_products_db() -> Iterable[Product]:
+    """Все товары для списка; у SQLite - ленивый запрос, сортировку и страницы которого выполняет база."""
+    return engine.products.listing()
 
 def save_all_products_db(products: List[Product]):
-    write_data(PRODUCTS_DB_PATH, [p.model_dump() for p in products])
+    engine.products.save(products)
+
+def find_product_by_id(product_id: str) -> Optional[Product]:
+    return engine.products.get(product_id)
 
+def add_product_db(product: Product) -> Future:
+    return engine.products.insert(product)
+
+def update_product_db(product: Product) -> Future:
+    return engine.products.update(product)
+
+def update_product_fields_db(product_id: str, fields: Dict[str, Any]) -> Tuple[Optional[Product], Optional[Future]]:
+    """Атомарно применяет изменения полей к текущей версии товара."""
+    return engine.products.modify(product_id, lambda product: product.model_copy(update=fields))
+
+def change_product_quantity_db(product_id: str, change: int) -> Tuple[Optional[Product], Optional[Future]]:
+    """
+    Атомарно меняет остаток товара на change (проверка и запись под одним локом,
+    поэтому параллельные покупки не продадут больше, чем есть). Бросает InsufficientStock.
+    С STOCK_WRITE_BEHIND Future завершен сразу, а запись на диск откладывается.
+    """
+    return engine.products.modify(product_id, _quantity_change(change), deferred=STOCK_WRITE_BEHIND)
+
+def _quantity_change(change: int):
+    def apply(product: Product) -> Product:
+        new_quantity = product.quantity + change
+        if new_quantity < 0:
+            raise InsufficientStock(product.quantity, product.id)
+        if new_quantity > MAX_QUANTITY:
+            raise QuantityLimitExceeded(f"Product quantity cannot exceed {MAX_QUANTITY}.")
+        return product.model_copy(update={"quantity": new_quantity})
+    return apply
+
+def bulk_write_products_db(new_products: List[Product], updates: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Product], Future]:
+    """
+    Добавляет товары и применяет изменения полей к существующим одной записью на диск.
+    Если какого-то товара нет, бросает RecordNotFound и ничего не меняет.
+    """
+    changes = [(product_id, lambda product, fields=fields: product.model_copy(update=fields)) for product_id, fields in updates]
+    return engine.products.apply_batch(new_products, changes)
+
+def purchase_products_db(lines: List[Tuple[str, int]]) -> Tuple[List[Product], Future]:
+    """
+    Списывает количество по всем строкам корзины атомарно: либо все строки, либо ни одной.
+    Бросает InsufficientStock (с product_id) или RecordNotFound.
+    """
+    changes = [(product_id, _quantity_change(-quantity)) for product_id, quantity in lines]
+    return engine.products.apply_batch([], changes, deferred=STOCK_WRITE_BEHIND)
+
+def delete_product_db(product_id: str) -> Optional[Future]:
+    return engine.products.delete(product_id)
+
+def products_version_db() -> str:
+    """Версия каталога товаров для ETag: меняется при любом изменении товаров."""
+    return engine.products.version()
+
+def product_version_db(product_id: str) -> Optional[str]:
+    return engine.products.item_version(product_id)
+
+def search_products_db(criteria: ProductSearch) -> Iterable[Product]:
+    return engine.products.search(criteria)
+
+def products_by_category_db(category_name: str) -> Iterable[Product]:
+    return engine.products.by_category(category_name)
+
+def inventory_stats_db(low_stock_threshold: int, low_stock_limit: int) -> InventoryStats:
+    """Сводка по складу: стоимость остатков, статистика цен по категориям и товары на исходе."""
+    return engine.products.inventory_stats(low_stock_threshold, low_stock_limit)
+
+# --- Функции для категорий ---
 def get_all_categories_db() -> List[Category]:
-    categories_data = read_data(CATEGORIES_DB_PATH)
-    return [Category(**cat) for cat in categories_data]
+    return engine.categories.load()
 
 def save_all_categories_db(categories: List[Category]):
-    write_data(CATEGORIES_DB_PATH, [cat.model_dump() for cat in categories])
\ No newline at end of file
+    engine.categories.save(categories)
+
+def categories_version_db() -> str:
+    return engine.categories.version()
+
+def find_category_db(name: str) -> Optional[Category]:
+    """Поиск категории по имени без учета регистра."""
+    return engine.categories.find_by_name(name)
+
+def add_category_db(category: Category) -> Future:
+    return engine.categories.insert(category)
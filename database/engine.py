@@ -0,0 +1,212 @@
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+from models.models import InventoryStats, Product, ProductSearch
+
+# Поля товара, по которым ищет универсальный параметр "search"
+PRODUCT_SEARCH_FIELDS = ("name", "id", "description", "category")
+
+def category_key(name: str) -> str:
+    """
+    Имя категории без учета регистра: по этому ключу категории уникальны, а товары находят свою категорию.
+    Везде str.lower(), а не casefold(): иначе "STRASSE" совпало бы с "Straße" в одном месте и нет - в другом.
+    """
+    return name.lower()
+
+# Префиксы ID и коллекции, в которых они используются
+ID_PREFIXES = {"p": "products", "a": "users", "w": "users", "c": "users"}
+
+def product_matches(product: Product, criteria: ProductSearch) -> bool:
+    """Точная проверка товара по всем критериям поиска (без учета регистра)."""
+    if criteria.search:
+        search_term = criteria.search.lower()
+        if not any(search_term in str(getattr(product, field)).lower() for field in PRODUCT_SEARCH_FIELDS):
+            return False
+    if criteria.name and criteria.name.lower() not in product.name.lower():
+        return False
+    if criteria.id and criteria.id.lower() not in product.id.lower():
+        return False
+    if criteria.category and criteria.category.lower() not in product.category.lower():
+        return False
+    if criteria.min_price is not None and product.price < criteria.min_price:
+        return False
+    if criteria.max_price is not None and product.price > criteria.max_price:
+        return False
+    return True
+
+# --- Генерация ID ---
+def generate_new_id(prefix: str, items: List[Dict[str, Any]]) -> str:
+    """Генерирует новый ID с инкрементом."""
+    if not items:
+        return f"{prefix}1"
+
+    max_id = 0
+    for item in items:
+        if item['id'].startswith(prefix):
+            try:
+                # Извлекаем числовую часть ID
+                num_part = int(item['id'][len(prefix):])
+                if num_part > max_id:
+                    max_id = num_part
+            except (ValueError, IndexError):
+                continue
+
+    return f"{prefix}{max_id + 1}"
+
+def max_id_number(prefix: str, ids: Iterable[str]) -> int:
+    """Наибольший числовой номер среди ID с данным префиксом (0, если таких нет)."""
+    return int(generate_new_id(prefix, [{"id": item_id} for item_id in ids])[len(prefix):]) - 1
+
+def completed_commit() -> Future:
+    """Future для изменения, которое движок уже записал синхронно."""
+    commit: Future = Future()
+    commit.set_result(None)
+    return commit
+
+# --- Интерфейс движка хранения ---
+class RecordNotFound(Exception):
+    """В пакетном изменении указана запись, которой нет в коллекции."""
+
+    def __init__(self, key: str):
+        super().__init__(f"Record not found: {key}")
+        self.key = key
+
+class Collection:
+    """
+    Коллекция записей одного типа в движке хранения.
+    Методы, меняющие данные, возвращают Future, который завершится после записи на диск.
+    """
+
+    def load(self) -> List[BaseModel]:
+        """Все записи в порядке добавления."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[BaseModel]:
+        raise NotImplementedError
+
+    def find_by(self, field: str, value: Any) -> Optional[BaseModel]:
+        """Поиск по уникальному полю (например, username)."""
+        raise NotImplementedError
+
+    def insert(self, item: BaseModel) -> Future:
+        raise NotImplementedError
+
+    def update(self, item: BaseModel) -> Future:
+        raise NotImplementedError
+
+    def modify(self, key: str, change: Callable[[BaseModel], BaseModel],
+               deferred: bool = False) -> Tuple[Optional[BaseModel], Optional[Future]]:
+        """
+        Атомарно вычисляет новую версию записи из текущей и сохраняет ее.
+        change может бросить исключение, тогда запись не меняется. (None, None), если записи нет.
+        deferred разрешает движку отложить запись на диск (write-behind): Future тогда
+        завершается сразу, а изменение попадет на диск в пределах окна движка.
+        """
+        raise NotImplementedError
+
+    def apply_batch(self, inserts: List[BaseModel],
+                    changes: List[Tuple[str, Callable[[BaseModel], BaseModel]]],
+                    deferred: bool = False) -> Tuple[List[BaseModel], Future]:
+        """
+        Добавляет inserts и применяет changes (по порядку, в том числе несколько к одной записи)
+        как одно изменение: одной записью на диск и по принципу "все или ничего".
+        Если change бросает исключение или записи нет (RecordNotFound), ничего не меняется.
+        Возвращает новые версии записей в порядке changes. deferred - как у modify, только для changes.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> Optional[Future]:
+        """None, если записи не было."""
+        raise NotImplementedError
+
+    def save(self, items: List[BaseModel]):
+        """Полностью заменяет содержимое коллекции."""
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """Непрозрачная версия коллекции: меняется при каждом изменении данных."""
+        raise NotImplementedError
+
+    def item_version(self, key: str) -> Optional[str]:
+        """Версия одной записи (None, если записи нет); может совпадать с версией коллекции."""
+        raise NotImplementedError
+
+    def flush(self) -> bool:
+        """
+        Дописывает на диск отложенные изменения, если движок их копит.
+        False, если записать не удалось (изменения остаются в очереди).
+        """
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+class PageableQuery:
+    """
+    Ленивая выборка записей, которую движок умеет сам отсортировать и разбить на страницы
+    (utils.pagination.paginate передает ему параметры страницы вместо сортировки в Python).
+    Обычная итерация отдает записи в порядке коллекции.
+    """
+
+    def fetch(self, sort: Optional[str], descending: bool, after: Optional[Tuple[Any, str]],
+              skip: int, limit: Optional[int]) -> Iterator[BaseModel]:
+        """
+        Записи в порядке (sort, id) или, без sort, в порядке коллекции: после ключа after
+        (значение, id), если он задан, с пропуском skip первых и не больше limit.
+        """
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[BaseModel]:
+        return self.fetch(None, False, None, 0, None)
+
+class ProductCollection(Collection):
+    """Коллекция товаров с запросами, которые движок выполняет сам (по своим индексам)."""
+
+    def listing(self) -> Iterable[Product]:
+        """Все товары для постраничного вывода; движок может вернуть PageableQuery."""
+        return self.load()
+
+    def search(self, criteria: ProductSearch) -> Iterable[Product]:
+        """Товары, подходящие под фильтры; движок может отдавать их лениво, по мере чтения."""
+        raise NotImplementedError
+
+    def by_category(self, category_name: str) -> Iterable[Product]:
+        """Товары категории без учета регистра."""
+        raise NotImplementedError
+
+    def inventory_stats(self, low_stock_threshold: int, low_stock_limit: int) -> InventoryStats:
+        """Сводка по складу (см. ProductColumns.inventory_stats), посчитанная по колоночному представлению."""
+        raise NotImplementedError
+
+class CategoryCollection(Collection):
+    """Коллекция категорий: имена уникальны без учета регистра."""
+
+    def find_by_name(self, name: str) -> Optional[BaseModel]:
+        """Категория с таким именем без учета регистра."""
+        raise NotImplementedError
+
+class StorageEngine:
+    """Движок хранения: три коллекции и счетчики ID."""
+
+    name = ""
+    users: Collection
+    products: ProductCollection
+    categories: CategoryCollection
+
+    def collections(self) -> Dict[str, Collection]:
+        return {"users": self.users, "products": self.products, "categories": self.categories}
+
+    def allocate_ids(self, prefix: str, count: int = 1) -> List[str]:
+        """Резервирует count новых ID с префиксом."""
+        raise NotImplementedError
+
+    def recover_ids(self):
+        """Сверяет счетчики ID с данными (вызывается при старте)."""
+        raise NotImplementedError
+
+    def flush(self) -> bool:
+        results = [collection.flush() for collection in self.collections().values()]
+        return all(results)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: collection.stats() for name, collection in self.collections().items()}
@@ -0,0 +1,149 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from pydantic import BaseModel
+
+# Минимальная длина подстроки, которую можно искать по индексу
+TRIGRAM_SIZE = 3
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+class TrigramIndex:
+    """
+    Инвертированный индекс триграмм по текстовым полям записей (без учета регистра).
+    Для поиска подстроки пересекаются списки записей по всем ее триграммам,
+    после чего кандидаты все равно проверяются точным сравнением.
+    """
+
+    def __init__(self, fields: Tuple[str, ...]):
+        self.fields = fields
+        self._postings: Dict[str, Dict[str, Set[str]]] = {field: defaultdict(set) for field in fields}
+
+    def rebuild(self, items: Iterable[Tuple[str, BaseModel]]):
+        self._postings = {field: defaultdict(set) for field in self.fields}
+        for key, item in items:
+            self.add(key, item)
+
+    def add(self, key: str, item: BaseModel):
+        for field in self.fields:
+            postings = self._postings[field]
+            for gram in trigrams(str(getattr(item, field)).lower()):
+                postings[gram].add(key)
+
+    def remove(self, key: str, item: BaseModel):
+        for field in self.fields:
+            postings = self._postings[field]
+            for gram in trigrams(str(getattr(item, field)).lower()):
+                keys = postings.get(gram)
+                if keys is None:
+                    continue
+                keys.discard(key)
+                if not keys:
+                    del postings[gram]
+
+    def candidates(self, field: str, term: str) -> Optional[Set[str]]:
+        """
+        Ключи записей, у которых поле может содержать term.
+        None означает, что запрос слишком короткий и индекс не сужает выборку.
+        """
+        grams = trigrams(term.lower())
+        if not grams:
+            return None
+        postings = self._postings[field]
+        lists: List[Set[str]] = []
+        for gram in grams:
+            keys = postings.get(gram)
+            if not keys:
+                return set()
+            lists.append(keys)
+        lists.sort(key=len)
+        result = set(lists[0])
+        for keys in lists[1:]:
+            result &= keys
+            if not result:
+                break
+        return result
+
+    def estimate(self, field: str, term: str) -> Optional[int]:
+        """Верхняя оценка числа кандидатов: длина самого короткого списка среди триграмм term."""
+        grams = trigrams(term.lower())
+        if not grams:
+            return None
+        postings = self._postings[field]
+        return min(len(postings.get(gram, ())) for gram in grams)
+
+class SortedIndex:
+    """
+    Отсортированный индекс по числовому полю: параллельные массивы значений и ключей,
+    упорядоченные по (значение, ключ). Диапазонный запрос стоит O(log n + k).
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._values: List[float] = []
+        self._keys: List[str] = []
+
+    def rebuild(self, items: Iterable[Tuple[str, BaseModel]]):
+        pairs = sorted((getattr(item, self.field), key) for key, item in items)
+        self._values = [value for value, _ in pairs]
+        self._keys = [key for _, key in pairs]
+
+    def _position(self, value: float, key: str) -> int:
+        lo = bisect_left(self._values, value)
+        hi = bisect_right(self._values, value, lo)
+        return bisect_left(self._keys, key, lo, hi)
+
+    def add(self, key: str, item: BaseModel):
+        value = getattr(item, self.field)
+        position = self._position(value, key)
+        self._values.insert(position, value)
+        self._keys.insert(position, key)
+
+    def remove(self, key: str, item: BaseModel):
+        value = getattr(item, self.field)
+        position = self._position(value, key)
+        if position < len(self._keys) and self._keys[position] == key and self._values[position] == value:
+            del self._values[position]
+            del self._keys[position]
+
+    def _bounds(self, min_value: Optional[float], max_value: Optional[float]) -> Tuple[int, int]:
+        lo = 0 if min_value is None else bisect_left(self._values, min_value)
+        hi = len(self._values) if max_value is None else bisect_right(self._values, max_value)
+        return lo, max(lo, hi)
+
+    def count_range(self, min_value: Optional[float], max_value: Optional[float]) -> int:
+        lo, hi = self._bounds(min_value, max_value)
+        return hi - lo
+
+    def range(self, min_value: Optional[float], max_value: Optional[float]) -> List[str]:
+        """Ключи записей со значением поля в [min_value, max_value], по возрастанию значения."""
+        lo, hi = self._bounds(min_value, max_value)
+        return self._keys[lo:hi]
+
+class HashIndex:
+    """Неуникальный индекс: значение поля (в нижнем регистре) -> ключи записей с этим значением."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self._keys: Dict[str, Set[str]] = {}
+
+    def rebuild(self, items: Iterable[Tuple[str, BaseModel]]):
+        self._keys = {}
+        for key, item in items:
+            self.add(key, item)
+
+    def add(self, key: str, item: BaseModel):
+        self._keys.setdefault(str(getattr(item, self.field)).lower(), set()).add(key)
+
+    def remove(self, key: str, item: BaseModel):
+        value = str(getattr(item, self.field)).lower()
+        keys = self._keys.get(value)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self._keys[value]
+
+    def get(self, value: str) -> Set[str]:
+        return self._keys.get(value.lower(), set())
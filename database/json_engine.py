@@ -0,0 +1,855 @@
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from itertools import islice
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Set, Tuple, Type
+from pydantic import BaseModel, TypeAdapter
+from models.models import UserInDB, Product, Category, ProductSearch, InventoryStats
+from database.engine import (
+    Collection, CategoryCollection, ProductCollection, RecordNotFound, StorageEngine, PRODUCT_SEARCH_FIELDS, ID_PREFIXES,
+    category_key, completed_commit, product_matches, max_id_number,
+)
+from database.analytics import ProductColumns
+from database.indexes import HashIndex, SortedIndex, TrigramIndex
+from database.snapshot import JsonSnapshotFormat, SnapshotFormat
+from metrics.metrics import WRITE_BEHIND_LAG, storage_timer
+
+# --- Запись файлов ---
+def write_bytes_synced(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_bytes_atomic(path: str, data: bytes):
+    """
+    Пишет снапшот во временный файл (с fsync) и подменяет им оригинал, чтобы при сбое
+    на диске остался либо старый, либо новый снапшот, но не полузаписанный.
+    """
+    tmp_path = f"{path}.tmp"
+    write_bytes_synced(tmp_path, data)
+    os.replace(tmp_path, path)
+
+def _stat_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# --- Кэш коллекций в памяти ---
+# Сколько записей снапшота разбирается перед одной пакетной валидацией
+VALIDATE_CHUNK = 10000
+# Пауза перед повторной записью пакета, который не удалось записать (например, кончилось место)
+FLUSH_RETRY_SECONDS = 1.0
+
+class CachedCollection(Collection):
+    """
+    Хранит в памяти уже провалидированные модели одного JSON-файла.
+    Файл перечитывается только при изменении его mtime/размера (правка вручную
+    или запись другим процессом). Записи этого процесса сразу обновляют кэш.
+
+    Записи лежат в словаре по первичному ключу (он же сохраняет порядок файла),
+    дополнительные уникальные поля индексируются отдельными словарями.
+
+    Изменения применяются к памяти под локом коллекции и ставятся в очередь единственному
+    писателю. Он раз в group_commit_ms записывает все накопленное одной операцией
+    с fsync и после этого подтверждает изменения через Future (групповой коммит).
+
+    Отложенные изменения (deferred, write-behind) писателя не будят: они копятся, пока
+    самому старому из них не исполнится write_behind_ms или пока грязных записей не станет
+    write_behind_max_dirty, либо пока их не заберет запись обычного изменения.
+    """
+
+    def __init__(self, path: str, model: Type[BaseModel], key: str, unique_fields: Tuple[str, ...] = (),
+                 group_commit_ms: float = 5, snapshot_format: SnapshotFormat = JsonSnapshotFormat(),
+                 write_behind_ms: float = 1000, write_behind_max_dirty: int = 1000):
+        self.path = path
+        # Формат файла снапшота: JSON или бинарный колоночный (database/snapshot.py)
+        self.snapshot_format = snapshot_format
+        # Имя коллекции для метрик: users, products, categories
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.group_commit_interval = group_commit_ms / 1000
+        # Окно долговечности отложенных изменений и порог грязных записей для досрочной записи
+        self.write_behind_interval = write_behind_ms / 1000
+        self.write_behind_max_dirty = write_behind_max_dirty
+        self.model = model
+        # Валидация всего списка одним вызовом заметно быстрее, чем model(**record) по одной записи
+        self._list_adapter = TypeAdapter(List[model])
+        self.key = key
+        self.unique_fields = unique_fields
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flushed_changes = 0
+        self.flush_errors = 0
+        self._items: Dict[str, BaseModel] = {}
+        self._indexes: Dict[str, Dict[Any, BaseModel]] = {field: {} for field in unique_fields}
+        # Порядковый номер записи в коллекции, чтобы выдавать результаты поиска в порядке каталога
+        self._positions: Dict[str, int] = {}
+        self._next_position = 0
+        # Версии для ETag: счетчик растет при каждом изменении в памяти и при перечитывании файла.
+        # epoch отличает запуски процесса, ведь после рестарта счетчик начинается заново
+        self._epoch = secrets.token_hex(4)
+        self._version = 0
+        self._item_versions: Dict[str, int] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._loaded = False
+        self._lock = threading.RLock()
+        # Очередь изменений для писателя; _io_lock берется раньше _lock и сериализует запись на диск
+        self._pending: List[Tuple[Optional[Dict[str, Any]], Future]] = []
+        self._unflushed = 0
+        # Писателю нужно записать очередь сразу (есть обычное изменение или порог грязных записей)
+        self._urgent = False
+        # Ключи с отложенными изменениями и момент (monotonic) самого старого из них
+        self._dirty: Set[str] = set()
+        self._oldest_deferred: Optional[float] = None
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    def _file_signature(self) -> Optional[Tuple]:
+        return _stat_signature(self.path)
+
+    def _rebuild(self, items: List[BaseModel]):
+        self._items = {getattr(item, self.key): item for item in items}
+        self._indexes = {
+            field: {getattr(item, field): item for item in self._items.values()}
+            for field in self.unique_fields
+        }
+        self._positions = {key: position for position, key in enumerate(self._items)}
+        self._next_position = len(self._items)
+        self._version += 1
+        self._item_versions = dict.fromkeys(self._items, self._version)
+
+    def _index_add(self, key: str, item: BaseModel):
+        for field in self.unique_fields:
+            self._indexes[field][getattr(item, field)] = item
+        self._version += 1
+        self._item_versions[key] = self._version
+        if key not in self._positions:
+            self._positions[key] = self._next_position
+            self._next_position += 1
+
+    def _index_remove(self, key: str, item: BaseModel, deleted: bool):
+        for field in self.unique_fields:
+            self._indexes[field].pop(getattr(item, field), None)
+        if deleted:
+            self._positions.pop(key, None)
+            self._item_versions.pop(key, None)
+            self._version += 1
+
+    def _in_catalog_order(self, keys: Iterable[str]) -> List[BaseModel]:
+        return [self._items[key] for key in sorted(keys, key=self._positions.__getitem__)]
+
+    def _timer(self, operation: str):
+        return storage_timer("json", self.name, operation)
+
+    def _iter_items(self, path: str) -> Iterator[BaseModel]:
+        """
+        Потоковая загрузка снапшота: записи разбираются по одной и валидируются пачками
+        по VALIDATE_CHUNK, так что сырые dict всего файла никогда не лежат в памяти разом.
+        Отсутствующий файл считается пустым, а от поврежденного остаются записи до места ошибки.
+        """
+        records = self.snapshot_format.iter_records(path)
+        while True:
+            with self._timer("parse"):
+                try:
+                    chunk = list(islice(records, VALIDATE_CHUNK))
+                except (FileNotFoundError, ValueError):
+                    return
+            if not chunk:
+                return
+            with self._timer("validate"):
+                yield from self._list_adapter.validate_python(chunk)
+
+    def _snapshot_records(self) -> List[Dict[str, Any]]:
+        return [item.model_dump() for item in self._items.values()]
+
+    def _write_snapshot(self, path: str, records: List[Dict[str, Any]]):
+        write_bytes_atomic(path, self.snapshot_format.encode(records))
+
+    def _read_items(self) -> List[BaseModel]:
+        return list(self._iter_items(self.path))
+
+    def _ensure_loaded(self):
+        signature = self._file_signature()
+        # Пока есть незаписанные изменения, память новее файла, и перечитывать его нельзя
+        if self._loaded and (signature == self._signature or self._unflushed):
+            self.hits += 1
+            return
+        self.misses += 1
+        self._rebuild(self._read_items())
+        self._signature = self._file_signature()
+        self._loaded = True
+
+    def _persist(self):
+        """Синхронно записывает всю коллекцию (используется полной перезаписью через save)."""
+        with self._timer("write"):
+            self._write_snapshot(self.path, self._snapshot_records())
+        self._signature = self._file_signature()
+
+    # --- Групповой коммит ---
+    def _journal_entry(self, op: str, key: str, item: Optional[BaseModel], old: Optional[BaseModel]) -> Optional[Dict[str, Any]]:
+        """Описание изменения для журнала. Базовая коллекция журнала не ведет и пишет файл целиком."""
+        return None
+
+    def _record_change(self, op: str, key: str, item: Optional[BaseModel], old: Optional[BaseModel],
+                       deferred: bool = False) -> Future:
+        # Вызывается под self._lock сразу после изменения в памяти
+        commit: Future = Future()
+        self._pending.append((self._journal_entry(op, key, item, old), commit))
+        self._unflushed += 1
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._writer_loop, name=f"writer:{self.path}", daemon=True)
+            self._writer.start()
+        if not deferred:
+            self._urgent = True
+            self._wake.set()
+            return commit
+        self._dirty.add(key)
+        if self._oldest_deferred is None:
+            # Писатель пересчитает срок ожидания по новому окну
+            self._oldest_deferred = time.monotonic()
+            self._wake.set()
+        if len(self._dirty) >= self.write_behind_max_dirty:
+            self._urgent = True
+            self._wake.set()
+        # Вызывающий не ждет диска: изменение уже видно, а записано будет в пределах окна
+        return completed_commit()
+
+    def _write_behind_deadline(self) -> Optional[float]:
+        if self._oldest_deferred is None:
+            return None
+        return self._oldest_deferred + self.write_behind_interval
+
+    def _writer_loop(self):
+        while True:
+            with self._lock:
+                deadline = self._write_behind_deadline()
+            self._wake.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            self._wake.clear()
+            with self._lock:
+                urgent = self._urgent
+                deadline = self._write_behind_deadline()
+            if urgent:
+                # Даем параллельным запросам накопить изменения, чтобы записать их одним fsync
+                time.sleep(self.group_commit_interval)
+            elif deadline is None or time.monotonic() < deadline:
+                continue
+            if not self.flush():
+                # Пакет остался в очереди: повторяем запись, пока диск не примет ее
+                time.sleep(FLUSH_RETRY_SECONDS)
+                self._wake.set()
+
+    def _batch_payload(self, entries: List[Optional[Dict[str, Any]]]) -> Any:
+        # Под локом: снимок всей коллекции, который писатель запишет целиком
+        return self._snapshot_records()
+
+    def _write_batch(self, payload: Any):
+        self._write_snapshot(self.path, payload)
+
+    def flush(self) -> bool:
+        """
+        Записывает все накопленные изменения одной операцией и подтверждает их ожидающим.
+        Если запись не удалась, пакет возвращается в начало очереди неподтвержденным
+        (изменения уже видны в памяти, и отказаться от них нельзя) и пишется повторно; тогда False.
+        """
+        with self._io_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+                oldest_deferred = self._take_deferred()
+                if not batch:
+                    return True
+                with self._timer("serialize"):
+                    payload = self._batch_payload([entry for entry, _ in batch])
+            try:
+                with self._timer("write"):
+                    self._write_batch(payload)
+            except Exception:
+                with self._lock:
+                    self._pending = batch + self._pending
+                    self._urgent = True
+                    if oldest_deferred is not None and (self._oldest_deferred is None or oldest_deferred < self._oldest_deferred):
+                        self._oldest_deferred = oldest_deferred
+                    self.flush_errors += 1
+                return False
+            if oldest_deferred is not None:
+                # Фактическая задержка долговечности: сколько самое старое отложенное изменение ждало диска
+                WRITE_BEHIND_LAG.observe(time.monotonic() - oldest_deferred, self.name)
+            with self._lock:
+                self._unflushed -= len(batch)
+                self._signature = self._file_signature()
+                self.flushes += 1
+                self.flushed_changes += len(batch)
+        for _, commit in batch:
+            commit.set_result(None)
+        return True
+
+    def _take_deferred(self) -> Optional[float]:
+        """Под локом: очередь забирается целиком, отложенных изменений в ней больше нет."""
+        oldest_deferred = self._oldest_deferred
+        self._urgent = False
+        self._dirty = set()
+        self._oldest_deferred = None
+        return oldest_deferred
+
+    # --- Чтение ---
+    def load(self) -> List[BaseModel]:
+        """Возвращает копию списка моделей, перечитывая файл только при необходимости."""
+        with self._lock:
+            self._ensure_loaded()
+            # Отдаем копию списка, чтобы append/remove в роутерах не портили кэш до сохранения
+            return list(self._items.values())
+
+    def get(self, key: str) -> Optional[BaseModel]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._items.get(key)
+
+    def find_by(self, field: str, value: Any) -> Optional[BaseModel]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._indexes[field].get(value)
+
+    # --- Изменения (возвращают Future, который завершится после записи на диск) ---
+    def insert(self, item: BaseModel) -> Future:
+        with self._lock:
+            self._ensure_loaded()
+            key = getattr(item, self.key)
+            # Индексы - раньше словаря записей: если индексация упадет, записи не останется нигде
+            self._index_add(key, item)
+            self._items[key] = item
+            return self._record_change("create", key, item, None)
+
+    def update(self, item: BaseModel, deferred: bool = False) -> Future:
+        """Заменяет запись с тем же ключом, сохраняя ее позицию в коллекции."""
+        with self._lock:
+            self._ensure_loaded()
+            key = getattr(item, self.key)
+            old = self._items.get(key)
+            if old is not None:
+                self._index_remove(key, old, deleted=False)
+            try:
+                self._index_add(key, item)
+            except Exception:
+                # Возвращаем в индексы прежнюю версию: в памяти остается то же, что и на диске
+                if old is not None:
+                    self._index_add(key, old)
+                raise
+            self._items[key] = item
+            return self._record_change("update", key, item, old, deferred)
+
+    def modify(self, key: str, change: Callable[[BaseModel], BaseModel],
+               deferred: bool = False) -> Tuple[Optional[BaseModel], Optional[Future]]:
+        """
+        Атомарно вычисляет новую версию записи из текущей и сохраняет ее.
+        change может бросить исключение, тогда запись не меняется. (None, None), если записи нет.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            old = self._items.get(key)
+            if old is None:
+                return None, None
+            item = change(old)
+            return item, self.update(item, deferred)
+
+    def apply_batch(self, inserts: List[BaseModel],
+                    changes: List[Tuple[str, Callable[[BaseModel], BaseModel]]],
+                    deferred: bool = False) -> Tuple[List[BaseModel], Future]:
+        with self._lock:
+            self._ensure_loaded()
+            # Сначала вычисляем все новые версии, чтобы ошибка в любой из них ничего не изменила
+            latest: Dict[str, BaseModel] = {}
+            results: List[BaseModel] = []
+            for key, change in changes:
+                current = latest.get(key) or self._items.get(key)
+                if current is None:
+                    raise RecordNotFound(key)
+                latest[key] = change(current)
+                results.append(latest[key])
+            # Все изменения ставятся в очередь под одним локом и попадают в одну запись писателя
+            commit = completed_commit()
+            for item in inserts:
+                commit = self.insert(item)
+            for item in latest.values():
+                update_commit = self.update(item, deferred)
+                # Отложенные изменения диска не ждут, а вставки пакета - ждут
+                if not inserts:
+                    commit = update_commit
+            return results, commit
+
+    def delete(self, key: str) -> Optional[Future]:
+        with self._lock:
+            self._ensure_loaded()
+            item = self._items.pop(key, None)
+            if item is None:
+                return None
+            self._index_remove(key, item, deleted=True)
+            return self._record_change("delete", key, None, item)
+
+    def save(self, items: List[BaseModel]):
+        """Полностью заменяет содержимое коллекции и сразу пишет его на диск."""
+        with self._io_lock:
+            with self._lock:
+                self._rebuild(list(items))
+                self._loaded = True
+                # Снимок ниже покрывает и все еще не записанные изменения
+                batch = self._pending
+                self._pending = []
+                self._take_deferred()
+                self._unflushed -= len(batch)
+                self._persist()
+        for _, commit in batch:
+            commit.set_result(None)
+
+    def version(self) -> str:
+        with self._lock:
+            self._ensure_loaded()
+            return f"{self._epoch}.{self._version}"
+
+    def item_version(self, key: str) -> Optional[str]:
+        with self._lock:
+            self._ensure_loaded()
+            version = self._item_versions.get(key)
+            return None if version is None else f"{self._epoch}.{version}"
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def stats(self) -> Dict[str, int]:
+        oldest = self._oldest_deferred
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "flushes": self.flushes,
+            "flushed_changes": self.flushed_changes,
+            "unflushed": self._unflushed,
+            "flush_errors": self.flush_errors,
+            "write_behind_dirty": len(self._dirty),
+            # Возраст самого старого отложенного изменения и граница, дольше которой оно не ждет
+            "write_behind_lag_ms": 0 if oldest is None else int((time.monotonic() - oldest) * 1000),
+            "write_behind_window_ms": int(self.write_behind_interval * 1000),
+        }
+
+# --- Журнал операций для товаров ---
+class JournaledCollection(CachedCollection):
+    """
+    Коллекция со снапшотом и append-only журналом изменений рядом с ним.
+    Каждая операция дописывает в журнал одну компактную строку JSON, поэтому
+    цена записи зависит от размера изменения, а не от размера всего файла;
+    групповой коммит дописывает накопленные строки одним write + fsync.
+    При загрузке журнал проигрывается поверх снапшота; когда он вырастает
+    больше порога, фоновый поток сворачивает его в новый снапшот.
+
+    Все записи журнала идемпотентны (храним итоговые значения полей, а не дельты),
+    поэтому повторное проигрывание после сбоя посреди компактации безопасно.
+    """
+
+    def __init__(self, path: str, model: Type[BaseModel], key: str, journal_path: str,
+                 compact_threshold: int, unique_fields: Tuple[str, ...] = (), group_commit_ms: float = 5,
+                 snapshot_format: SnapshotFormat = JsonSnapshotFormat(),
+                 write_behind_ms: float = 1000, write_behind_max_dirty: int = 1000):
+        super().__init__(path, model, key, unique_fields, group_commit_ms, snapshot_format,
+                         write_behind_ms, write_behind_max_dirty)
+        self.journal_path = journal_path
+        # Сюда переименовывается журнал на время компактации
+        self.compacting_path = f"{journal_path}.compacting"
+        self.compact_threshold = compact_threshold
+        self.compactions = 0
+        self._compacting = False
+        # Меняется при полной перезаписи, чтобы устаревшая компактация не затерла свежий снапшот
+        self._generation = 0
+        # Длина журнала до неудачной записи, если отрезать хвост сразу не удалось
+        self._journal_valid_size: Optional[int] = None
+
+    def _file_signature(self) -> Optional[Tuple]:
+        return (
+            _stat_signature(self.path),
+            _stat_signature(self.compacting_path),
+            _stat_signature(self.journal_path),
+        )
+
+    def _read_items(self) -> List[BaseModel]:
+        items = {getattr(item, self.key): item for item in self._iter_items(self.path)}
+        with self._timer("replay"):
+            self._replay(self.compacting_path, items)
+            self._replay(self.journal_path, items)
+        return list(items.values())
+
+    def _replay(self, path: str, items: Dict[str, BaseModel]):
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            valid_size = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    entry = json.loads(line)
+                except ValueError:
+                    # Хвост, недописанный из-за сбоя: отрезаем его, чтобы новые записи
+                    # не склеились с мусором
+                    break
+                self._apply(entry, items)
+                valid_size += len(line)
+            else:
+                return
+        with open(path, "r+b") as f:
+            f.truncate(valid_size)
+
+    def _apply(self, entry: Dict[str, Any], items: Dict[str, BaseModel]):
+        # Журнал проигрывается поверх уже провалидированных моделей снапшота
+        op = entry["op"]
+        if op == "create":
+            item = self.model.model_validate(entry["data"])
+            items[getattr(item, self.key)] = item
+        elif op == "update":
+            item = items.get(entry["id"])
+            if item is not None:
+                items[entry["id"]] = self.model.model_validate({**item.model_dump(), **entry["fields"]})
+        elif op == "delete":
+            items.pop(entry["id"], None)
+
+    def _journal_entry(self, op: str, key: str, item: Optional[BaseModel], old: Optional[BaseModel]) -> Optional[Dict[str, Any]]:
+        if op == "create":
+            return {"op": "create", "data": item.model_dump()}
+        if op == "update":
+            data = item.model_dump()
+            old_data = old.model_dump() if old is not None else {}
+            fields = {name: value for name, value in data.items() if old_data.get(name) != value}
+            if not fields:
+                return None
+            return {"op": "update", "id": key, "fields": fields}
+        return {"op": "delete", "id": key}
+
+    def _batch_payload(self, entries: List[Optional[Dict[str, Any]]]) -> Any:
+        return "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in self._coalesce(entries))
+
+    def _coalesce(self, entries: List[Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Склеивает обновления одной записи внутри пакета в одну строку журнала: сотни покупок
+        горячего товара за окно write-behind дают одну запись с итоговым остатком.
+        Обновления разных записей независимы, поэтому порядок между ними не важен;
+        create и delete записи завершают цепочку ее обновлений.
+        """
+        merged: List[Dict[str, Any]] = []
+        open_updates: Dict[str, int] = {}
+        for entry in entries:
+            if entry is None:
+                continue
+            if entry["op"] == "update":
+                position = open_updates.get(entry["id"])
+                if position is not None:
+                    previous = merged[position]
+                    merged[position] = {**previous, "fields": {**previous["fields"], **entry["fields"]}}
+                    continue
+                open_updates[entry["id"]] = len(merged)
+            else:
+                open_updates.pop(entry["data"][self.key] if entry["op"] == "create" else entry["id"], None)
+            merged.append(entry)
+        return merged
+
+    def _write_batch(self, payload: Any):
+        # Вызывается писателем под _io_lock
+        if not payload:
+            return
+        data = payload.encode("utf-8")
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if self._journal_valid_size is not None:
+                # Прошлая неудачная запись не смогла отрезать свой хвост
+                os.ftruncate(fd, self._journal_valid_size)
+                self._journal_valid_size = None
+            start = os.lseek(fd, 0, os.SEEK_END)
+            try:
+                written = 0
+                while written < len(data):
+                    written += os.write(fd, data[written:])
+                os.fsync(fd)
+            except BaseException:
+                # Недописанная строка остановила бы проигрывание журнала на себе, и следующие
+                # подтвержденные записи после нее потерялись бы: отрезаем журнал до начала пакета
+                self._journal_valid_size = start
+                os.ftruncate(fd, start)
+                self._journal_valid_size = None
+                raise
+            journal_size = start + len(data)
+        finally:
+            os.close(fd)
+        if journal_size >= self.compact_threshold and not self._compacting:
+            self._start_compaction()
+
+    def _start_compaction(self):
+        """Отделяет текущий журнал и запускает запись снапшота в фоне (вызывается под _io_lock)."""
+        with self._lock:
+            if os.path.exists(self.compacting_path):
+                # Остался хвост прошлой компактации, прерванной сбоем: дописываем к нему
+                with open(self.journal_path, "rb") as src, open(self.compacting_path, "ab") as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.compacting_path)
+            self._signature = self._file_signature()
+            self._compacting = True
+            snapshot = self._snapshot_records()
+            generation = self._generation
+        threading.Thread(target=self._compact, args=(snapshot, generation), daemon=True).start()
+
+    def _compact(self, snapshot: List[Dict[str, Any]], generation: int):
+        tmp_path = f"{self.path}.compact.tmp"
+        try:
+            with self._timer("compact"):
+                write_bytes_synced(tmp_path, self.snapshot_format.encode(snapshot))
+            with self._io_lock, self._lock:
+                if generation == self._generation:
+                    os.replace(tmp_path, self.path)
+                    os.remove(self.compacting_path)
+                    self.compactions += 1
+                    self._signature = self._file_signature()
+                else:
+                    os.remove(tmp_path)
+        finally:
+            self._compacting = False
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), "compactions": self.compactions}
+
+    def _persist(self):
+        # Полная перезапись (save_all_products_db) делает журнал ненужным
+        self._generation += 1
+        with self._timer("write"):
+            self._write_snapshot(self.path, self._snapshot_records())
+        for path in (self.compacting_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._journal_valid_size = None
+        self._signature = self._file_signature()
+
+# --- Индексы и поиск по товарам ---
+class ProductsCollection(JournaledCollection, ProductCollection):
+    """
+    Журналируемая коллекция товаров с индексами для поиска:
+    триграммным по текстовым полям, отсортированным по цене и по категории,
+    и колоночным представлением для аналитики склада.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.text_index = TrigramIndex(PRODUCT_SEARCH_FIELDS)
+        self.price_index = SortedIndex("price")
+        self.category_index = HashIndex("category")
+        self.columns = ProductColumns()
+
+    def _rebuild(self, items: List[BaseModel]):
+        super()._rebuild(items)
+        self.text_index.rebuild(self._items.items())
+        self.price_index.rebuild(self._items.items())
+        self.category_index.rebuild(self._items.items())
+        self.columns.rebuild(self._items.items())
+
+    def _index_add(self, key: str, item: BaseModel):
+        # Колонки - первыми: только они могут отказаться принять значение, и тогда остальные индексы не тронуты
+        self.columns.add(key, item)
+        super()._index_add(key, item)
+        self.text_index.add(key, item)
+        self.price_index.add(key, item)
+        self.category_index.add(key, item)
+
+    def _index_remove(self, key: str, item: BaseModel, deleted: bool):
+        super()._index_remove(key, item, deleted)
+        self.text_index.remove(key, item)
+        self.price_index.remove(key, item)
+        self.category_index.remove(key, item)
+        self.columns.remove(key, item)
+
+    def _text_estimate(self, criteria: ProductSearch) -> Optional[int]:
+        """Дешевая оценка числа кандидатов от текстовых фильтров; None, если индекс не применим."""
+        estimates: List[int] = []
+        if criteria.search:
+            per_field = [self.text_index.estimate(field, criteria.search) for field in PRODUCT_SEARCH_FIELDS]
+            if all(estimate is not None for estimate in per_field):
+                estimates.append(sum(per_field))
+        for field in ("name", "id", "category"):
+            term = getattr(criteria, field)
+            if term:
+                estimate = self.text_index.estimate(field, term)
+                if estimate is not None:
+                    estimates.append(estimate)
+        return min(estimates) if estimates else None
+
+    def _text_candidates(self, criteria: ProductSearch) -> Optional[Set[str]]:
+        """Пересечение кандидатов от всех текстовых фильтров; None, если индекс не помог."""
+        candidate_sets: List[Set[str]] = []
+        if criteria.search:
+            per_field = [self.text_index.candidates(field, criteria.search) for field in PRODUCT_SEARCH_FIELDS]
+            if all(keys is not None for keys in per_field):
+                candidate_sets.append(set().union(*per_field))
+        for field in ("name", "id", "category"):
+            term = getattr(criteria, field)
+            if term:
+                keys = self.text_index.candidates(field, term)
+                if keys is not None:
+                    candidate_sets.append(keys)
+        if not candidate_sets:
+            return None
+        candidate_sets.sort(key=len)
+        result = set(candidate_sets[0])
+        for keys in candidate_sets[1:]:
+            result &= keys
+        return result
+
+    def _plan_candidates(self, criteria: ProductSearch) -> Optional[Iterable[str]]:
+        """
+        Выбирает самый селективный индекс как источник кандидатов:
+        диапазон цен (точный размер за O(log n)) или текстовые фильтры (оценка по спискам триграмм).
+        None означает полный проход по каталогу.
+        """
+        price_count = None
+        if criteria.min_price is not None or criteria.max_price is not None:
+            price_count = self.price_index.count_range(criteria.min_price, criteria.max_price)
+        text_estimate = self._text_estimate(criteria)
+
+        if price_count is not None and (text_estimate is None or price_count <= text_estimate):
+            return self.price_index.range(criteria.min_price, criteria.max_price)
+        if text_estimate is not None:
+            return self._text_candidates(criteria)
+        return None
+
+    def search(self, criteria: ProductSearch) -> Iterator[Product]:
+        """
+        Ленивый фильтр: товары проверяются по мере чтения результата, поэтому первая страница
+        полного прохода останавливается на limit совпадениях и промежуточный список не строится.
+        Под локом снимается только список ссылок на кандидатов, чтобы запись во время
+        потоковой отдачи не сломала обход.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            candidates = self._plan_candidates(criteria)
+            if candidates is None:
+                products = list(self._items.values())
+            else:
+                products = self._in_catalog_order(candidates)
+        return (product for product in products if product_matches(product, criteria))
+
+    def by_category(self, category_name: str) -> Iterator[Product]:
+        with self._lock:
+            self._ensure_loaded()
+            return iter(self._in_catalog_order(self.category_index.get(category_name)))
+
+    def inventory_stats(self, low_stock_threshold: int, low_stock_limit: int) -> InventoryStats:
+        # Колонки обновляются вместе с остальными индексами, поэтому пересчет - только векторный проход
+        with self._lock:
+            self._ensure_loaded()
+            return self.columns.inventory_stats(low_stock_threshold, low_stock_limit)
+
+class CategoriesCollection(CachedCollection, CategoryCollection):
+    """Категории с индексом по имени в нижнем регистре для проверки существования за O(1)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._by_folded_name: Dict[str, Category] = {}
+
+    def _rebuild(self, items: List[BaseModel]):
+        super()._rebuild(items)
+        self._by_folded_name = {category_key(item.name): item for item in self._items.values()}
+
+    def _index_add(self, key: str, item: BaseModel):
+        super()._index_add(key, item)
+        self._by_folded_name[category_key(item.name)] = item
+
+    def _index_remove(self, key: str, item: BaseModel, deleted: bool):
+        super()._index_remove(key, item, deleted)
+        self._by_folded_name.pop(category_key(item.name), None)
+
+    def find_by_name(self, name: str) -> Optional[Category]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._by_folded_name.get(category_key(name))
+
+# --- Персистентные счетчики ID ---
+class IdSequences:
+    """
+    Счетчики последнего выданного номера для каждого префикса ID.
+    Хранятся в database/sequences.json, поэтому выдача ID не требует обхода коллекции.
+    При старте значения сверяются с данными (на случай потери файла или ручной правки),
+    а выдача идет под локом, так что параллельные создания не получат одинаковый ID.
+    """
+
+    def __init__(self, path: str, engine: StorageEngine):
+        self.path = path
+        self.engine = engine
+        self._counters: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+
+    def recover(self):
+        """Читает счетчики с диска и поднимает их до максимального ID в данных."""
+        with self._lock:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    counters = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                counters = {}
+            for prefix, collection_name in ID_PREFIXES.items():
+                ids = [item.id for item in self.engine.collections()[collection_name].load()]
+                counters[prefix] = max(int(counters.get(prefix, 0)), max_id_number(prefix, ids))
+            self._counters = counters
+            self._persist()
+
+    def _persist(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._counters, f)
+        os.replace(tmp_path, self.path)
+
+    def allocate(self, prefix: str, count: int = 1) -> List[str]:
+        """Резервирует count новых ID одним обновлением файла."""
+        if self._counters is None:
+            self.recover()
+        with self._lock:
+            start = self._counters.get(prefix, 0) + 1
+            self._counters[prefix] = start + count - 1
+            self._persist()
+        return [f"{prefix}{number}" for number in range(start, start + count)]
+
+# --- Движок ---
+class JsonStorageEngine(StorageEngine):
+    """Хранение в JSON-файлах с кэшем в памяти, журналом товаров и групповым коммитом."""
+
+    name = "json"
+
+    def __init__(self, users_path: str, products_path: str, categories_path: str,
+                 products_journal_path: str, sequences_path: str,
+                 journal_compact_bytes: int, group_commit_ms: float,
+                 snapshot_format: SnapshotFormat = JsonSnapshotFormat(),
+                 write_behind_ms: float = 1000, write_behind_max_dirty: int = 1000):
+        self.users = CachedCollection(
+            users_path, UserInDB, key="id", unique_fields=("username",), group_commit_ms=group_commit_ms,
+            snapshot_format=snapshot_format,
+        )
+        self.products = ProductsCollection(
+            products_path, Product, key="id",
+            journal_path=products_journal_path,
+            compact_threshold=journal_compact_bytes,
+            group_commit_ms=group_commit_ms,
+            snapshot_format=snapshot_format,
+            write_behind_ms=write_behind_ms,
+            write_behind_max_dirty=write_behind_max_dirty,
+        )
+        self.categories = CategoriesCollection(
+            categories_path, Category, key="name", group_commit_ms=group_commit_ms, snapshot_format=snapshot_format
+        )
+        self.sequences = IdSequences(sequences_path, self)
+
+    def allocate_ids(self, prefix: str, count: int = 1) -> List[str]:
+        return self.sequences.allocate(prefix, count)
+
+    def recover_ids(self):
+        self.sequences.recover()
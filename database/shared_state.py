@@ -0,0 +1,155 @@
+"""
+Состояние, общее для всех воркеров uvicorn на одной машине: локальный файл SQLite (WAL)
+со счетчиками лимитов запросов и журналом инвалидаций кэшей. Включается переменной
+SHARED_STATE_PATH; без нее каждый процесс живет сам по себе.
+"""
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Сколько ждать блокировку записи, занятую другим воркером
+BUSY_TIMEOUT_MS = 5000
+# Сколько секунд хранить инвалидации: воркер, отставший сильнее, все равно сбросит кэш по TTL
+INVALIDATION_RETENTION_SECONDS = 3600
+# Как часто (в вызовах incr) удалять истекшие счетчики лимитов
+RATE_LIMIT_PURGE_EVERY = 1000
+
+class SharedState:
+    """
+    Общий файл состояния. Все методы потокобезопасны; между процессами изменения
+    упорядочивает сама SQLite (BEGIN IMMEDIATE).
+
+    Инвалидации - широковещательный журнал: писатель добавляет строку (канал, ключ),
+    а каждый воркер в sync() дочитывает строки после последней увиденной и вызывает
+    подписчиков канала. Новый процесс начинает с конца журнала, ведь его кэши пусты.
+    id строк растут у всех воркеров одинаково, а epoch меняется, только если файл создан заново.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Счетчики и инвалидации не обязаны переживать сбой питания, fsync на каждый запрос не нужен
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        with self.transaction() as connection:
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (secrets.token_hex(4),))
+            self.epoch: str = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        # (callback, передавать ли id строки) по каналам
+        self._subscribers: Dict[str, List[Tuple[Callable[..., None], bool]]] = {}
+        self._last_seen = self.connection.execute("SELECT coalesce(max(id), 0) FROM invalidations").fetchone()[0]
+        # sync() целиком под своим локом: подписчики получают строки строго по порядку id
+        self._sync_lock = threading.Lock()
+        self._increments = 0
+
+    @property
+    def last_seen(self) -> int:
+        """id последней строки журнала, уже разосланной подписчикам этого процесса."""
+        return self._last_seen
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    # --- Счетчики лимитов запросов (фиксированное окно) ---
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        """Увеличивает счетчик; истекшее окно начинается заново со сроком now + expiry."""
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute("SELECT count, expires_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                count, expires_at = amount, now + expiry
+            else:
+                count, expires_at = row[0] + amount, row[1]
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?)",
+                (key, count, expires_at),
+            )
+            self._increments += 1
+            if self._increments % RATE_LIMIT_PURGE_EVERY == 0:
+                connection.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+        return count
+
+    def get(self, key: str) -> int:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        with self.lock:
+            row = self.connection.execute("SELECT expires_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def clear(self, key: str):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def reset(self) -> int:
+        with self.transaction() as connection:
+            return connection.execute("DELETE FROM rate_limits").rowcount
+
+    # --- Инвалидации кэшей ---
+    def subscribe(self, channel: str, callback: Callable[..., None], with_id: bool = False):
+        """
+        callback(key) вызывается в sync() для каждой инвалидации канала, в том числе своей;
+        с with_id - callback(id, key), где id - номер строки в общем журнале.
+        """
+        self._subscribers.setdefault(channel, []).append((callback, with_id))
+
+    def publish(self, channel: str, key: str):
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT INTO invalidations (channel, key, created_at) VALUES (?, ?, ?)", (channel, key, now)
+            )
+            connection.execute(
+                "DELETE FROM invalidations WHERE created_at < ?", (now - INVALIDATION_RETENTION_SECONDS,)
+            )
+
+    def sync(self):
+        """Применяет инвалидации, опубликованные воркерами после прошлого вызова."""
+        with self._sync_lock:
+            with self.lock:
+                rows: List[Tuple[int, str, str]] = self.connection.execute(
+                    "SELECT id, channel, key FROM invalidations WHERE id > ? ORDER BY id", (self._last_seen,)
+                ).fetchall()
+                if rows:
+                    self._last_seen = rows[-1][0]
+            for entry_id, channel, key in rows:
+                for callback, with_id in self._subscribers.get(channel, ()):
+                    if with_id:
+                        callback(entry_id, key)
+                    else:
+                        callback(key)
@@ -0,0 +1,302 @@
+"""
+Форматы снапшотов коллекций на диске: JSON (читается человеком) и компактный
+бинарный колоночный формат. Конвертер между ними:
+
+    python -m database.snapshot database/products.json database/products.snap
+    python -m database.snapshot database/products.snap database/products.json
+
+Формат определяется по расширению файла (.json или .snap).
+"""
+import json
+import os
+import re
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+
+# --- Бинарный колоночный формат ---
+# Файл: заголовок, описания колонок, затем данные колонок подряд. Все числа little-endian.
+#   заголовок: MAGIC (4 байта), версия формата (u16), число записей (u32), число колонок (u16)
+#   колонка:   длина имени (u16), имя (UTF-8), тип (1 байт: s/o - строка, f - float64, i - int64)
+#   данные:    f/i - массив значений;
+#              s - длина текста в байтах (u64) и все строки колонки через символ NUL одной UTF-8 строкой;
+#              o - то же без разделителя, но перед текстом смещения в символах (u64, записей + 1),
+#                  для колонок, где сам NUL встречается в значениях.
+# Строки колонки декодируются одним вызовом и режутся split'ом или срезами.
+MAGIC = b"TMCS"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHIH")
+_NAME_LENGTH = struct.Struct("<H")
+_U64 = struct.Struct("<Q")
+_ARRAY_TYPES = {"f": "d", "i": "q"}
+SEPARATOR = "\x00"
+# API принимает строки с одиночными суррогатами ("\ud800"): строгий utf-8 не смог бы их записать,
+# и пакет с такой записью вечно повторялся бы в очереди писателя
+TEXT_ERRORS = "surrogatepass"
+
+def _column_type(values: List[Any], name: str) -> str:
+    if all(type(value) is str for value in values):
+        return "o" if any(SEPARATOR in value for value in values) else "s"
+    if all(type(value) is int for value in values):
+        return "i"
+    if all(type(value) in (int, float) for value in values):
+        return "f"
+    raise ValueError(f"Колонку {name!r} нельзя записать в бинарный снапшот: поддерживаются str, int и float")
+
+def _le_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_le_bytes(typecode: str, raw: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def encode_binary(records: List[Dict[str, Any]]) -> bytes:
+    names = list(records[0]) if records else []
+    columns = [[record[name] for record in records] for name in names]
+    types = [_column_type(values, name) for name, values in zip(names, columns)]
+
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(records), len(names))]
+    for name, column_type in zip(names, types):
+        encoded_name = name.encode("utf-8")
+        parts.append(_NAME_LENGTH.pack(len(encoded_name)) + encoded_name + column_type.encode("ascii"))
+    for values, column_type in zip(columns, types):
+        if column_type == "s":
+            text = SEPARATOR.join(values).encode("utf-8", TEXT_ERRORS)
+            parts.append(_U64.pack(len(text)))
+            parts.append(text)
+        elif column_type == "o":
+            offsets = array("Q", [0])
+            position = 0
+            for value in values:
+                position += len(value)
+                offsets.append(position)
+            text = "".join(values).encode("utf-8", TEXT_ERRORS)
+            parts.append(_le_bytes(offsets))
+            parts.append(_U64.pack(len(text)))
+            parts.append(text)
+        else:
+            parts.append(_le_bytes(array(_ARRAY_TYPES[column_type], values)))
+    return b"".join(parts)
+
+def _decode_columns(raw: bytes) -> Tuple[List[str], List[List[Any]]]:
+    view = memoryview(raw)
+    if len(view) < _HEADER.size:
+        raise ValueError("Бинарный снапшот обрезан")
+    magic, version, count, column_count = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("Файл не является бинарным снапшотом")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия бинарного снапшота: {version}")
+    position = _HEADER.size
+
+    schema: List[Tuple[str, str]] = []
+    for _ in range(column_count):
+        (name_length,) = _NAME_LENGTH.unpack_from(view, position)
+        position += _NAME_LENGTH.size
+        name = bytes(view[position:position + name_length]).decode("utf-8")
+        position += name_length
+        schema.append((name, chr(view[position])))
+        position += 1
+
+    columns: List[List[Any]] = []
+    for name, column_type in schema:
+        if column_type == "s":
+            (text_size,) = _U64.unpack_from(view, position)
+            position += _U64.size
+            text = str(view[position:position + text_size], "utf-8", TEXT_ERRORS)
+            position += text_size
+            columns.append(text.split(SEPARATOR) if count else [])
+        elif column_type == "o":
+            offsets_size = (count + 1) * 8
+            offsets = _from_le_bytes("Q", view[position:position + offsets_size]).tolist()
+            position += offsets_size
+            (text_size,) = _U64.unpack_from(view, position)
+            position += _U64.size
+            text = str(view[position:position + text_size], "utf-8", TEXT_ERRORS)
+            position += text_size
+            columns.append([text[offsets[i]:offsets[i + 1]] for i in range(count)])
+        elif column_type in _ARRAY_TYPES:
+            size = count * 8
+            columns.append(_from_le_bytes(_ARRAY_TYPES[column_type], view[position:position + size]).tolist())
+            position += size
+        else:
+            raise ValueError(f"Неизвестный тип колонки {column_type!r}")
+    if position != len(view):
+        raise ValueError("Бинарный снапшот поврежден: лишние или недостающие байты")
+
+    return [name for name, _ in schema], columns
+
+def decode_binary(raw: bytes) -> List[Dict[str, Any]]:
+    return list(iter_binary(raw))
+
+def iter_binary(raw: bytes) -> Iterator[Dict[str, Any]]:
+    """Записи бинарного снапшота по одной: колонки декодируются целиком, а dict строятся лениво."""
+    names, columns = _decode_columns(raw)
+    for row in zip(*columns):
+        yield dict(zip(names, row))
+
+# --- Потоковый разбор JSON ---
+# Сколько символов читать из файла за раз
+STREAM_CHUNK_SIZE = 1 << 16
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Разделитель после элемента массива вместе с пробелами вокруг него
+_SEPARATOR = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+
+def iter_json_array(f: TextIO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Разбирает JSON-массив из файла по одному элементу сканером json.JSONDecoder.
+    В памяти держится только текущий кусок файла и разбираемый элемент, поэтому
+    расход памяти не зависит от размера файла. Ошибки формата - ValueError.
+    """
+    scan_once = json.JSONDecoder().scan_once
+    buffer, position = "", 0
+
+    def read_more() -> bool:
+        # Отбрасывает уже разобранное начало буфера и дочитывает следующий кусок
+        nonlocal buffer, position
+        chunk = f.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        return bool(chunk)
+
+    def skip_whitespace() -> bool:
+        # False, если файл закончился
+        nonlocal position
+        while True:
+            position = _WHITESPACE.match(buffer, position).end()
+            if position < len(buffer):
+                return True
+            if not read_more():
+                return False
+
+    if not skip_whitespace() or buffer[position] != "[":
+        raise ValueError("Ожидается JSON-массив")
+    position += 1
+    if not skip_whitespace():
+        raise ValueError("Неожиданный конец JSON-массива")
+    if buffer[position] == "]":
+        position += 1
+    else:
+        while True:
+            try:
+                item, end = scan_once(buffer, position)
+                separator = _SEPARATOR.match(buffer, end)
+            except (StopIteration, ValueError):
+                separator = None
+            if separator is None or separator.end() == len(buffer):
+                # Элемент или разделитель оборван границей куска (число могло оборваться и разобраться
+                # не целиком): дочитываем файл и разбираем элемент заново
+                if read_more():
+                    continue
+                if separator is None:
+                    raise ValueError("Поврежденный JSON-массив")
+            yield item
+            position = separator.end()
+            if separator.group(1) == "]":
+                break
+    if skip_whitespace():
+        raise ValueError("Лишние данные после JSON-массива")
+
+# --- Форматы снапшотов ---
+class SnapshotFormat:
+    """Кодирование списка записей (dict) в байты файла снапшота и обратно."""
+
+    name = ""
+    extension = ""
+
+    def encode(self, records: List[Dict[str, Any]]) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, raw: bytes) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def iter_records(self, path: str) -> Iterator[Dict[str, Any]]:
+        """Записи файла по одной, не собирая их в общий список."""
+        raise NotImplementedError
+
+class JsonSnapshotFormat(SnapshotFormat):
+    name = "json"
+    extension = ".json"
+
+    def encode(self, records: List[Dict[str, Any]]) -> bytes:
+        return json.dumps(records, indent=4).encode("utf-8")
+
+    def decode(self, raw: bytes) -> List[Dict[str, Any]]:
+        return json.loads(raw)
+
+    def iter_records(self, path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from iter_json_array(f)
+
+class BinarySnapshotFormat(SnapshotFormat):
+    name = "binary"
+    extension = ".snap"
+
+    def encode(self, records: List[Dict[str, Any]]) -> bytes:
+        return encode_binary(records)
+
+    def decode(self, raw: bytes) -> List[Dict[str, Any]]:
+        return decode_binary(raw)
+
+    def iter_records(self, path: str) -> Iterator[Dict[str, Any]]:
+        # Колоночный формат нельзя разобрать построчно, но он в разы компактнее JSON
+        with open(path, "rb") as f:
+            raw = f.read()
+        yield from iter_binary(raw)
+
+SNAPSHOT_FORMATS: Dict[str, SnapshotFormat] = {
+    fmt.name: fmt for fmt in (JsonSnapshotFormat(), BinarySnapshotFormat())
+}
+
+def get_snapshot_format(name: str) -> SnapshotFormat:
+    try:
+        return SNAPSHOT_FORMATS[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный формат снапшота {name!r}: ожидается {' или '.join(SNAPSHOT_FORMATS)}")
+
+def snapshot_path(path: str, snapshot_format: SnapshotFormat) -> str:
+    """Путь к снапшоту в нужном формате: database/products.json -> database/products.snap."""
+    return os.path.splitext(path)[0] + snapshot_format.extension
+
+def format_for_path(path: str) -> SnapshotFormat:
+    extension = os.path.splitext(path)[1]
+    for snapshot_format in SNAPSHOT_FORMATS.values():
+        if snapshot_format.extension == extension:
+            return snapshot_format
+    raise ValueError(f"Не удалось определить формат снапшота по расширению {path!r}")
+
+def convert(source_path: str, target_path: str):
+    """Перекодирует снапшот из одного формата в другой (форматы - по расширениям файлов)."""
+    with open(source_path, "rb") as f:
+        records = format_for_path(source_path).decode(f.read())
+    data = format_for_path(target_path).encode(records)
+    tmp_path = f"{target_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target_path)
+
+def migrate_snapshot(json_path: str, snapshot_format: SnapshotFormat) -> str:
+    """
+    Путь к снапшоту в нужном формате. Если его еще нет, а JSON-файл есть (формат только что
+    переключили), данные сначала перекодируются, иначе коллекция стартовала бы пустой
+    и первая же запись сохранила бы снапшот из одной новой записи.
+    """
+    path = snapshot_path(json_path, snapshot_format)
+    if path != json_path and not os.path.exists(path) and os.path.exists(json_path):
+        convert(json_path, path)
+    return path
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Использование: python -m database.snapshot ИСТОЧНИК ЦЕЛЬ  (например, products.json products.snap)")
+        sys.exit(2)
+    convert(sys.argv[1], sys.argv[2])
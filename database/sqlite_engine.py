@@ -0,0 +1,389 @@
+import os
+import secrets
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+from pydantic import BaseModel
+from models.models import UserInDB, Product, Category, ProductSearch, InventoryStats
+from metrics.metrics import storage_timer
+from database.analytics import ProductColumns
+from database.engine import (
+    Collection, CategoryCollection, PageableQuery, ProductCollection, RecordNotFound, StorageEngine, PRODUCT_SEARCH_FIELDS, ID_PREFIXES,
+    category_key, completed_commit, max_id_number,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    role TEXT NOT NULL,
+    hashed_password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    price REAL NOT NULL,
+    category TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    category_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_category_key ON products (category_key);
+CREATE INDEX IF NOT EXISTS products_price ON products (price);
+CREATE INDEX IF NOT EXISTS products_price_id ON products (price, id);
+CREATE INDEX IF NOT EXISTS products_quantity_id ON products (quantity, id);
+CREATE INDEX IF NOT EXISTS products_name_id ON products (name, id);
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    name_key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    prefix TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stamps (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Сколько ждать блокировку записи, занятую другим процессом
+SQLITE_BUSY_TIMEOUT_MS = 5000
+# Сколько строк читает один запрос ленивой выборки; следующая пачка продолжается по ключу последней строки,
+# поэтому между пачками не остается открытых курсоров и лок соединения не держится
+QUERY_BATCH_ROWS = 500
+
+# Строка products без модели: колонкам аналитики хватает атрибутов
+ProductRow = namedtuple("ProductRow", "id name price category quantity")
+
+def _lower(value: Any) -> Optional[str]:
+    # lower() в SQLite понимает только ASCII, а фильтры API сравнивают как str.lower() в Python
+    return None if value is None else str(value).lower()
+
+class SqliteCollection(Collection):
+    """
+    Таблица SQLite как коллекция. Порядок записей - порядок вставки (rowid),
+    update меняет строку на месте и не сдвигает ее в конец.
+    extra_columns - вычисляемые колонки для индексов (например, категория в нижнем регистре).
+    """
+
+    def __init__(self, engine: "SqliteStorageEngine", table: str, model: Type[BaseModel], key: str,
+                 extra_columns: Optional[Dict[str, Callable[[BaseModel], Any]]] = None):
+        self.engine = engine
+        self.table = table
+        self.model = model
+        self.key = key
+        self.fields = tuple(model.model_fields)
+        self.extra_columns = extra_columns or {}
+        columns = self.fields + tuple(self.extra_columns)
+        self._select = f"SELECT {', '.join(self.fields)} FROM {table}"
+        self._insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})"
+        self._update = (
+            f"UPDATE {table} SET {', '.join(f'{c} = :{c}' for c in columns if c != key)} WHERE {key} = :{key}"
+        )
+
+    def _to_row(self, item: BaseModel) -> Dict[str, Any]:
+        row = item.model_dump()
+        for column, compute in self.extra_columns.items():
+            row[column] = compute(item)
+        return row
+
+    def _from_row(self, row: sqlite3.Row) -> BaseModel:
+        return self.model(**dict(zip(self.fields, row)))
+
+    def _timer(self, operation: str):
+        return storage_timer("sqlite", self.table, operation)
+
+    @contextmanager
+    def _writing(self) -> Iterator[sqlite3.Connection]:
+        # Замер включает ожидание блокировки записи. Штамп версии таблицы растет в той же транзакции,
+        # поэтому его видят все процессы, работающие с файлом базы, ровно вместе с изменением.
+        # Если транзакция ничего не изменила (записи не нашлось), версия не растет, и ETag с кэшем ответов живут дальше
+        with self._timer("write"), self.engine.transaction() as connection:
+            changes_before = connection.total_changes
+            yield connection
+            if connection.total_changes == changes_before:
+                return
+            connection.execute(
+                "INSERT INTO stamps (name, value) VALUES (?, 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1",
+                (self.table,),
+            )
+
+    def query(self, where: str = "", params: Tuple[Any, ...] = ()) -> List[BaseModel]:
+        sql = self._select + (f" WHERE {where}" if where else "") + " ORDER BY rowid"
+        with self._timer("read"), self.engine.lock:
+            rows = self.engine.connection.execute(sql, params).fetchall()
+        with self._timer("validate"):
+            return [self._from_row(row) for row in rows]
+
+    def load(self) -> List[BaseModel]:
+        return self.query()
+
+    def iter_query(self, where: str, params: Tuple[Any, ...], sort: Optional[str], descending: bool,
+                   after: Optional[Tuple[Any, str]], skip: int, limit: Optional[int]) -> Iterator[BaseModel]:
+        """
+        Ленивая выборка с ORDER BY (sort, ключ) или по rowid, условием по ключу after и LIMIT/OFFSET в SQL.
+        Строки читаются пачками по QUERY_BATCH_ROWS, модели создаются по мере чтения.
+        """
+        if sort is not None and sort not in self.fields:
+            raise ValueError(f"Unknown field: {sort}")
+        direction = "DESC" if descending else "ASC"
+        comparison = "<" if descending else ">"
+        if sort is None:
+            order_by = f"rowid {direction}"
+            key_columns = "rowid"
+        else:
+            order_by = f"{sort} {direction}, {self.key} {direction}"
+            key_columns = f"({sort}, {self.key})"
+        select = f"SELECT rowid, {', '.join(self.fields)} FROM {self.table}"
+        sort_position = None if sort is None else 1 + self.fields.index(sort)
+        key_position = 1 + self.fields.index(self.key)
+        last_key: Any = None if after is None else tuple(after)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            batch = QUERY_BATCH_ROWS if remaining is None else min(QUERY_BATCH_ROWS, remaining)
+            clauses = [f"({where})"] if where else []
+            bind: List[Any] = list(params)
+            if last_key is not None:
+                clauses.append(f"{key_columns} {comparison} {'?' if sort is None else '(?, ?)'}")
+                bind.extend([last_key] if sort is None else last_key)
+            sql = select + (f" WHERE {' AND '.join(clauses)}" if clauses else "") + f" ORDER BY {order_by} LIMIT ? OFFSET ?"
+            bind.extend([batch, skip])
+            with self._timer("read"), self.engine.lock:
+                rows = self.engine.connection.execute(sql, bind).fetchall()
+            skip = 0
+            for row in rows:
+                yield self._from_row(row[1:])
+            if len(rows) < batch:
+                return
+            last = rows[-1]
+            last_key = last[0] if sort is None else (last[sort_position], last[key_position])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def get(self, key: str) -> Optional[BaseModel]:
+        return self.find_by(self.key, key)
+
+    def find_by(self, field: str, value: Any) -> Optional[BaseModel]:
+        if field not in self.fields:
+            raise ValueError(f"Unknown field: {field}")
+        with self._timer("read"), self.engine.lock:
+            row = self.engine.connection.execute(f"{self._select} WHERE {field} = ? LIMIT 1", (value,)).fetchone()
+        return None if row is None else self._from_row(row)
+
+    def version(self) -> str:
+        # Одинакова во всех воркерах и переживает рестарт: ETag, выданный одним процессом, подходит и другим
+        with self.engine.lock:
+            row = self.engine.connection.execute("SELECT value FROM stamps WHERE name = ?", (self.table,)).fetchone()
+        return f"{self.engine.epoch}.{row[0] if row else 0}"
+
+    def item_version(self, key: str) -> Optional[str]:
+        # Отдельных версий строк нет: версия записи - версия всей таблицы, если запись есть
+        with self.engine.lock:
+            exists = self.engine.connection.execute(
+                f"SELECT 1 FROM {self.table} WHERE {self.key} = ?", (key,)
+            ).fetchone()
+            return self.version() if exists else None
+
+    def insert(self, item: BaseModel) -> Future:
+        with self._writing() as connection:
+            connection.execute(self._insert, self._to_row(item))
+        return completed_commit()
+
+    def update(self, item: BaseModel) -> Future:
+        with self._writing() as connection:
+            connection.execute(self._update, self._to_row(item))
+        return completed_commit()
+
+    def modify(self, key: str, change: Callable[[BaseModel], BaseModel],
+               deferred: bool = False) -> Tuple[Optional[BaseModel], Optional[Future]]:
+        # deferred не нужен: в WAL с synchronous=NORMAL коммит и так не ждет fsync.
+        # BEGIN IMMEDIATE сразу берет блокировку записи, поэтому чтение и запись атомарны и между процессами
+        with self._writing() as connection:
+            row = connection.execute(f"{self._select} WHERE {self.key} = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            item = change(self._from_row(row))
+            connection.execute(self._update, self._to_row(item))
+        return item, completed_commit()
+
+    def apply_batch(self, inserts: List[BaseModel],
+                    changes: List[Tuple[str, Callable[[BaseModel], BaseModel]]],
+                    deferred: bool = False) -> Tuple[List[BaseModel], Future]:
+        latest: Dict[str, BaseModel] = {}
+        results: List[BaseModel] = []
+        with self._writing() as connection:
+            for key, change in changes:
+                current = latest.get(key)
+                if current is None:
+                    row = connection.execute(f"{self._select} WHERE {self.key} = ?", (key,)).fetchone()
+                    if row is None:
+                        raise RecordNotFound(key)
+                    current = self._from_row(row)
+                latest[key] = change(current)
+                results.append(latest[key])
+            connection.executemany(self._insert, [self._to_row(item) for item in inserts])
+            connection.executemany(self._update, [self._to_row(item) for item in latest.values()])
+        return results, completed_commit()
+
+    def delete(self, key: str) -> Optional[Future]:
+        with self._writing() as connection:
+            cursor = connection.execute(f"DELETE FROM {self.table} WHERE {self.key} = ?", (key,))
+        return completed_commit() if cursor.rowcount else None
+
+    def save(self, items: List[BaseModel]):
+        with self._writing() as connection:
+            connection.execute(f"DELETE FROM {self.table}")
+            connection.executemany(self._insert, [self._to_row(item) for item in items])
+
+class SqliteQuery(PageableQuery):
+    """Отфильтрованная выборка из таблицы: сортировка, страницы и курсор выполняются в SQL."""
+
+    def __init__(self, collection: SqliteCollection, where: str = "", params: Tuple[Any, ...] = ()):
+        self.collection = collection
+        self.where = where
+        self.params = params
+
+    def fetch(self, sort: Optional[str], descending: bool, after: Optional[Tuple[Any, str]],
+              skip: int, limit: Optional[int]) -> Iterator[BaseModel]:
+        return self.collection.iter_query(self.where, self.params, sort, descending, after, skip, limit)
+
+class SqliteProductsCollection(SqliteCollection, ProductCollection):
+    """Товары: фильтры поиска, выборка по категории, сортировка и страницы выполняются в SQL по индексам."""
+
+    def __init__(self, engine: "SqliteStorageEngine"):
+        super().__init__(engine, "products", Product, key="id",
+                         extra_columns={"category_key": lambda product: category_key(product.category)})
+        # Колонки для аналитики и версия таблицы, по которой они построены
+        self._columns: Optional[Tuple[str, ProductColumns]] = None
+        self._columns_lock = threading.Lock()
+
+    def listing(self) -> SqliteQuery:
+        return SqliteQuery(self)
+
+    def search(self, criteria: ProductSearch) -> SqliteQuery:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if criteria.search:
+            term = criteria.search.lower()
+            clauses.append("(" + " OR ".join(f"instr(py_lower({field}), ?) > 0" for field in PRODUCT_SEARCH_FIELDS) + ")")
+            params.extend([term] * len(PRODUCT_SEARCH_FIELDS))
+        for field in ("name", "id", "category"):
+            term = getattr(criteria, field)
+            if term:
+                clauses.append(f"instr(py_lower({field}), ?) > 0")
+                params.append(term.lower())
+        if criteria.min_price is not None:
+            clauses.append("price >= ?")
+            params.append(criteria.min_price)
+        if criteria.max_price is not None:
+            clauses.append("price <= ?")
+            params.append(criteria.max_price)
+        return SqliteQuery(self, " AND ".join(clauses), tuple(params))
+
+    def by_category(self, category_name: str) -> SqliteQuery:
+        return SqliteQuery(self, "category_key = ?", (category_key(category_name),))
+
+    def inventory_stats(self, low_stock_threshold: int, low_stock_limit: int) -> InventoryStats:
+        # Записи могут прийти и из других воркеров, поэтому колонки не поддерживаются по месту,
+        # а перестраиваются из таблицы при первом запросе после смены версии
+        with self._columns_lock:
+            version = self.version()
+            if self._columns is None or self._columns[0] != version:
+                with self._timer("read"), self.engine.lock:
+                    rows = self.engine.connection.execute(
+                        "SELECT id, name, price, category, quantity FROM products ORDER BY rowid"
+                    ).fetchall()
+                columns = ProductColumns()
+                columns.rebuild((row[0], ProductRow._make(row)) for row in rows)
+                self._columns = (version, columns)
+            return self._columns[1].inventory_stats(low_stock_threshold, low_stock_limit)
+
+class SqliteCategoriesCollection(SqliteCollection, CategoryCollection):
+    """Категории с уникальным индексом по имени в нижнем регистре."""
+
+    def __init__(self, engine: "SqliteStorageEngine"):
+        super().__init__(engine, "categories", Category, key="name",
+                         extra_columns={"name_key": lambda category: category_key(category.name)})
+
+    def find_by_name(self, name: str) -> Optional[Category]:
+        with self._timer("read"), self.engine.lock:
+            row = self.engine.connection.execute(
+                f"{self._select} WHERE name_key = ?", (category_key(name),)
+            ).fetchone()
+        return None if row is None else self._from_row(row)
+
+class SqliteStorageEngine(StorageEngine):
+    """
+    Хранение в локальной базе SQLite (WAL): точечные, диапазонные запросы и выборки
+    по категории выполняются по индексам базы, без загрузки всего каталога в Python.
+    Если файл базы создается впервые, в него переносятся данные из seed (обычно JSON-движка).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, seed: Optional[Callable[[], StorageEngine]] = None):
+        self.path = path
+        is_new = not os.path.exists(path)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Несколько воркеров пишут в один файл: ждем чужую транзакцию, а не падаем с "database is locked"
+        self.connection.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.create_function("py_lower", 1, _lower, deterministic=True)
+        self.connection.executescript(SCHEMA)
+        # Эпоха хранится в самой базе: общая для воркеров и меняется, только если файл базы создан заново
+        self.connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (secrets.token_hex(4),))
+        self.epoch = self.connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+        self.users = SqliteCollection(self, "users", UserInDB, key="id")
+        self.products = SqliteProductsCollection(self)
+        self.categories = SqliteCategoriesCollection(self)
+
+        if is_new and seed is not None:
+            self._import_from(seed())
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _import_from(self, source: StorageEngine):
+        for name, collection in self.collections().items():
+            collection.save(source.collections()[name].load())
+
+    def allocate_ids(self, prefix: str, count: int = 1) -> List[str]:
+        with self.transaction() as connection:
+            row = connection.execute("SELECT value FROM sequences WHERE prefix = ?", (prefix,)).fetchone()
+            start = (row[0] if row else 0) + 1
+            connection.execute(
+                "INSERT INTO sequences (prefix, value) VALUES (?, ?) "
+                "ON CONFLICT (prefix) DO UPDATE SET value = excluded.value",
+                (prefix, start + count - 1),
+            )
+        return [f"{prefix}{number}" for number in range(start, start + count)]
+
+    def recover_ids(self):
+        with self.transaction() as connection:
+            for prefix, table in ID_PREFIXES.items():
+                ids = [row[0] for row in connection.execute(f"SELECT id FROM {table} WHERE id LIKE ?", (prefix + "%",))]
+                connection.execute(
+                    "INSERT INTO sequences (prefix, value) VALUES (?, ?) "
+                    "ON CONFLICT (prefix) DO UPDATE SET value = max(value, excluded.value)",
+                    (prefix, max_id_number(prefix, ids)),
+                )
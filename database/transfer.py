@@ -0,0 +1,340 @@
+"""
+Офлайн-импорт и экспорт товаров, категорий и пользователей в CSV и NDJSON
+(запускается при остановленном сервере, с теми же переменными окружения):
+
+    python -m database.transfer import products products.csv --unknown-categories create
+    python -m database.transfer import users users.ndjson --errors bad_rows.ndjson
+    python -m database.transfer export products products.ndjson
+
+Файл читается потоково и режется на пачки строк, которые валидируются моделями
+(ProductCreate, CategoryCreate, пользователи - по username, role и паролю или его хешу)
+в пуле процессов. Плохие строки собираются в отчет с номерами строк. Если они есть,
+по умолчанию не записывается ничего; с --skip-invalid импортируются остальные строки.
+Новые записи получают свежие ID и попадают в коллекцию одним пакетом (одна запись на диск).
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+from database.engine import category_key
+from models.models import Category, CategoryCreate, Product, ProductCreate, UserBase, UserInDB
+
+# Сколько строк уходит в процесс-валидатор за раз
+IMPORT_CHUNK_ROWS = 10000
+# Сколько плохих строк печатать в консоль (все - в файл --errors)
+ERRORS_PRINT_LIMIT = 20
+# Префиксы ID пользователей по ролям (как при регистрации через API)
+ROLE_ID_PREFIXES: Dict[str, str] = {"admin": "a", "worker": "w", "customer": "c"}
+
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+# Строка файла: (номер строки, значения CSV или текст строки NDJSON)
+Row = Tuple[int, Any]
+# Плохая строка: (номер строки, описание ошибки)
+BadRow = Tuple[int, str]
+
+class UserImport(UserBase):
+    """Пользователь в файле импорта: пароль открытым текстом или готовый bcrypt-хеш."""
+    password: Optional[str] = None
+    hashed_password: Optional[str] = None
+
+    @field_validator("password", "hashed_password", mode="before")
+    @classmethod
+    def empty_as_missing(cls, value: Any) -> Any:
+        # Пустая ячейка CSV означает, что значения нет
+        return None if value == "" else value
+
+IMPORT_MODELS: Dict[str, Type[BaseModel]] = {
+    "products": ProductCreate,
+    "categories": CategoryCreate,
+    "users": UserImport,
+}
+EXPORT_MODELS: Dict[str, Type[BaseModel]] = {
+    "products": Product,
+    "categories": Category,
+    "users": UserInDB,
+}
+
+def detect_format(path: str, name: Optional[str] = None) -> str:
+    if name:
+        return name
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        return FORMATS[extension]
+    except KeyError:
+        raise ValueError(f"Не удалось определить формат по расширению {path!r}: укажите --format csv или ndjson")
+
+# --- Валидация в пуле процессов ---
+_password_context = None
+
+def _hash_password(password: str) -> str:
+    # Та же схема, что у security.security.pwd_context; сам модуль безопасности
+    # в процессе-валидаторе не импортируется, ведь он открывает базу
+    global _password_context
+    if _password_context is None:
+        from passlib.context import CryptContext
+        _password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _password_context.hash(password)
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()
+    )
+
+def validate_chunk(kind: str, header: Optional[List[str]], rows: List[Row]) -> Tuple[List[Tuple[int, Tuple[Any, ...]]], List[BadRow]]:
+    """
+    Выполняется в процессе пула. header - колонки CSV (None для NDJSON, где строка
+    разбирается и валидируется одним вызовом pydantic). Возвращает значения полей
+    хороших строк (кортежи в порядке полей модели, их дешево передавать между процессами)
+    и ошибки плохих.
+    """
+    model = IMPORT_MODELS[kind]
+    fields = tuple(model.model_fields)
+    valid: List[Tuple[int, Tuple[Any, ...]]] = []
+    bad: List[BadRow] = []
+    for line, row in rows:
+        try:
+            if header is None:
+                item = model.model_validate_json(row)
+            else:
+                item = model.model_validate(dict(zip(header, row)))
+        except ValidationError as error:
+            bad.append((line, _describe(error)))
+            continue
+        if kind == "users":
+            if item.hashed_password is None:
+                if item.password is None:
+                    bad.append((line, "password: требуется password или hashed_password"))
+                    continue
+                item.hashed_password = _hash_password(item.password)
+            valid.append((line, (item.username, item.role, item.hashed_password)))
+        else:
+            valid.append((line, tuple(getattr(item, name) for name in fields)))
+    return valid, bad
+
+# --- Чтение файла ---
+def iter_rows(path: str, file_format: str) -> Tuple[Optional[List[str]], Iterator[Row]]:
+    """Заголовок CSV (None для NDJSON) и строки файла с номерами, без чтения файла целиком."""
+    if file_format == "csv":
+        # utf-8-sig: CSV из Excel начинается с BOM
+        f = open(path, "r", encoding="utf-8-sig", newline="")
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+
+        def csv_rows() -> Iterator[Row]:
+            with f:
+                line = reader.line_num
+                for values in reader:
+                    # Запись CSV может занимать несколько строк файла: номер - первая из них
+                    if values:
+                        yield line + 1, values
+                    line = reader.line_num
+        return header, csv_rows()
+
+    def ndjson_rows() -> Iterator[Row]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line, text in enumerate(f, 1):
+                if text.strip():
+                    yield line, text
+    return None, ndjson_rows()
+
+def validate_file(kind: str, path: str, file_format: str, workers: int,
+                  chunk_rows: int = IMPORT_CHUNK_ROWS) -> Iterator[Tuple[List[Tuple[int, Tuple[Any, ...]]], List[BadRow]]]:
+    """
+    Результаты validate_chunk по пачкам в порядке файла. В работе одновременно не больше
+    двух пачек на процесс, поэтому сырые строки не копятся в памяти быстрее, чем их проверяют.
+    """
+    header, rows = iter_rows(path, file_format)
+    # spawn, а не fork: у движка хранения есть фоновые потоки-писатели, их нельзя копировать в дочерний процесс
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending: Deque[Future] = deque()
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if chunk:
+                pending.append(pool.submit(validate_chunk, kind, header, chunk))
+            if pending and (not chunk or len(pending) >= workers * 2):
+                yield pending.popleft().result()
+            elif not chunk:
+                break
+
+# --- Импорт ---
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    bad_rows: List[BadRow] = field(default_factory=list)
+    created_categories: List[str] = field(default_factory=list)
+    written: bool = False
+
+def import_file(kind: str, path: str, file_format: Optional[str] = None, unknown_categories: str = "reject",
+                skip_invalid: bool = False, workers: Optional[int] = None,
+                chunk_rows: int = IMPORT_CHUNK_ROWS) -> ImportReport:
+    """
+    Импортирует файл в коллекцию kind. Проверки, которым нужны данные базы (существование
+    категории, уникальность имени пользователя или категории), выполняются здесь же,
+    в основном процессе, по мере поступления проверенных пачек.
+    """
+    from database.db import engine
+
+    file_format = detect_format(path, file_format)
+    workers = workers or os.cpu_count() or 1
+    report = ImportReport()
+    engine.recover_ids()
+
+    # Ключи без учета регистра, как у find_category_db
+    categories = {category_key(category.name): category.name for category in engine.categories.load()}
+    new_categories: Dict[str, Category] = {}
+    usernames = {user.username for user in engine.users.load()} if kind == "users" else set()
+    fields = tuple(IMPORT_MODELS[kind].model_fields)
+    accepted: List[Tuple[Any, ...]] = []
+
+    for valid, bad in validate_file(kind, path, file_format, workers, chunk_rows):
+        report.rows += len(valid) + len(bad)
+        report.bad_rows.extend(bad)
+        for line, values in valid:
+            if kind == "products":
+                category = values[fields.index("category")]
+                key = category_key(category)
+                if key not in categories:
+                    if unknown_categories != "create":
+                        report.bad_rows.append((line, f"category: Category '{category}' does not exist."))
+                        continue
+                    categories[key] = category
+                    new_categories[key] = Category(name=category)
+            elif kind == "categories":
+                key = category_key(values[0])
+                if key in categories:
+                    report.bad_rows.append((line, f"name: Category '{values[0]}' already exists."))
+                    continue
+                categories[key] = values[0]
+            elif kind == "users":
+                if values[0] in usernames:
+                    report.bad_rows.append((line, f"username: User '{values[0]}' already exists."))
+                    continue
+                usernames.add(values[0])
+            accepted.append(values)
+
+    # Пачки приходят по порядку, но проверки основного процесса дописывают ошибки позже
+    report.bad_rows.sort()
+    if report.bad_rows and not skip_invalid:
+        return report
+
+    if kind == "products":
+        ids = engine.allocate_ids("p", len(accepted)) if accepted else []
+        items: List[BaseModel] = [
+            Product.model_construct(id=item_id, **dict(zip(fields, values))) for item_id, values in zip(ids, accepted)
+        ]
+    elif kind == "categories":
+        items = [Category.model_construct(name=values[0]) for values in accepted]
+    else:
+        by_prefix: Dict[str, int] = {}
+        for _, role, _ in accepted:
+            by_prefix[ROLE_ID_PREFIXES[role]] = by_prefix.get(ROLE_ID_PREFIXES[role], 0) + 1
+        allocated = {prefix: iter(engine.allocate_ids(prefix, count)) for prefix, count in by_prefix.items()}
+        items = [
+            UserInDB.model_construct(id=next(allocated[ROLE_ID_PREFIXES[role]]), username=username,
+                                     role=role, hashed_password=hashed_password)
+            for username, role, hashed_password in accepted
+        ]
+
+    # Категории - раньше товаров: товар не должен оказаться на диске без своей категории
+    if new_categories:
+        engine.categories.apply_batch(list(new_categories.values()), [])
+        report.created_categories = [category.name for category in new_categories.values()]
+    if items:
+        engine.collections()[kind].apply_batch(items, [])
+    if not engine.flush():
+        raise OSError("Не удалось записать импортированные записи на диск")
+    report.imported = len(items)
+    report.written = True
+    return report
+
+# --- Экспорт ---
+def export_file(kind: str, path: str, file_format: Optional[str] = None) -> int:
+    """Пишет коллекцию kind в файл построчно; возвращает число записей."""
+    from database.db import engine
+
+    file_format = detect_format(path, file_format)
+    fields = list(EXPORT_MODELS[kind].model_fields)
+    items: Iterable[BaseModel] = engine.collections()[kind].load()
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        if file_format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for item in items:
+                writer.writerow([getattr(item, name) for name in fields])
+                count += 1
+        else:
+            for item in items:
+                f.write(item.model_dump_json())
+                f.write("\n")
+                count += 1
+    os.replace(tmp_path, path)
+    return count
+
+# --- Командная строка ---
+def write_errors(path: str, bad_rows: List[BadRow]):
+    with open(path, "w", encoding="utf-8") as f:
+        for line, message in bad_rows:
+            f.write(json.dumps({"line": line, "error": message}, ensure_ascii=False))
+            f.write("\n")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m database.transfer", description="Импорт и экспорт данных TechMart")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="загрузить записи из CSV или NDJSON")
+    import_parser.add_argument("collection", choices=sorted(IMPORT_MODELS))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="по умолчанию - по расширению файла")
+    import_parser.add_argument("--unknown-categories", choices=["reject", "create"], default="reject",
+                               help="товары с несуществующей категорией: считать ошибкой или создать категорию")
+    import_parser.add_argument("--skip-invalid", action="store_true",
+                               help="импортировать хорошие строки, даже если в файле есть плохие")
+    import_parser.add_argument("--errors", help="файл NDJSON для всех плохих строк")
+    import_parser.add_argument("--workers", type=int, help="число процессов-валидаторов (по умолчанию - число ядер)")
+    import_parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_ROWS)
+
+    export_parser = commands.add_parser("export", help="выгрузить коллекцию в CSV или NDJSON")
+    export_parser.add_argument("collection", choices=sorted(EXPORT_MODELS))
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="по умолчанию - по расширению файла")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.command == "export":
+        count = export_file(args.collection, args.path, args.format)
+        print(f"Выгружено записей: {count}")
+        return 0
+
+    report = import_file(args.collection, args.path, args.format, args.unknown_categories,
+                         args.skip_invalid, args.workers, args.chunk_size)
+    for line, message in report.bad_rows[:ERRORS_PRINT_LIMIT]:
+        print(f"строка {line}: {message}", file=sys.stderr)
+    if len(report.bad_rows) > ERRORS_PRINT_LIMIT:
+        print(f"... и еще {len(report.bad_rows) - ERRORS_PRINT_LIMIT} плохих строк", file=sys.stderr)
+    if args.errors:
+        write_errors(args.errors, report.bad_rows)
+    if report.created_categories:
+        print(f"Созданы категории: {', '.join(report.created_categories)}")
+    print(f"Строк: {report.rows}, импортировано: {report.imported}, с ошибками: {len(report.bad_rows)}")
+    if not report.written:
+        print("Файл содержит ошибки, ничего не записано (--skip-invalid импортирует остальные строки)", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
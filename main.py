@@ -1,15 +1,28 @@
 import os
 import time
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-from routers import auth, users, products
+from routers import auth, users, products, cart
+from database.db import SHARED_STATE_PATH, recover_id_sequences, flush_all_db, get_cache_stats
+from security.security import get_password_pool_stats
+from utils.rate_limits import rate_limit_storage_uri
+from utils.response_cache import response_cache
+from utils.compression import CompressionMiddleware, compressed_bodies
+from utils.events import product_events
+from metrics.metrics import (
+    REGISTRY, CONTENT_TYPE, HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, render_metrics,
+)
 
 # --- Настройка лимитера для защиты от brute-force ---
-limiter = Limiter(key_func=get_remote_address, default_limits=["100 per minute"])
+# С несколькими воркерами счетчики лежат в общем файле SHARED_STATE_PATH, иначе лимит делился бы на число процессов
+limiter = Limiter(
+    key_func=get_remote_address, default_limits=["100 per minute"],
+    storage_uri=rate_limit_storage_uri(SHARED_STATE_PATH),
+)
 
 # --- Инициализация приложения FastAPI ---
 app = FastAPI(title="TechMart API")
@@ -18,19 +31,62 @@ app = FastAPI(title="TechMart API")
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# --- Middleware для логирования запросов (опционально) ---
+# --- Сжатие ответов ---
+# Добавлено раньше middleware метрик, поэтому оказывается внутри него: время сжатия попадает в гистограммы
+app.add_middleware(CompressionMiddleware)
+
+# --- Middleware для логирования запросов и метрик ---
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    HTTP_REQUESTS_IN_FLIGHT.inc(request.method)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec(request.method)
+        process_time = time.time() - start_time
+        # Шаблон маршрута вместо пути, чтобы ID товаров не плодили отдельные ряды метрик
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(process_time, request.method, getattr(route, "path", "unmatched"), status_code)
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
+# --- Метрики, которые снимаются в момент запроса /metrics ---
+def collect_storage_stats():
+    for collection, stats in get_cache_stats().items():
+        for name, value in stats.items():
+            yield f"storage_{name}", "gauge", "Счетчики движка хранения по коллекциям.", {"collection": collection}, value
+
+def collect_password_pool_stats():
+    stats = get_password_pool_stats()
+    for name in ("workers", "queue_depth", "queue_depth_max"):
+        yield f"password_hash_pool_{name}", "gauge", "Состояние пула bcrypt.", {"executor": stats["executor"]}, stats[name]
+
+def collect_response_cache_stats():
+    for name, value in response_cache.stats().items():
+        yield f"response_cache_{name}", "gauge", "Кэш готовых тел ответов.", {}, value
+
+def collect_compression_stats():
+    for name, value in compressed_bodies.stats().items():
+        yield f"response_compression_{name}", "gauge", "Сжатие ответов и кэш сжатых тел.", {}, value
+
+def collect_event_stats():
+    for name, value in product_events.stats().items():
+        yield f"product_events_{name}", "gauge", "Поток SSE об изменениях товаров.", {}, value
+
+REGISTRY.register_collector(collect_storage_stats)
+REGISTRY.register_collector(collect_response_cache_stats)
+REGISTRY.register_collector(collect_compression_stats)
+REGISTRY.register_collector(collect_password_pool_stats)
+REGISTRY.register_collector(collect_event_stats)
+
 # --- Подключение роутеров ---
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(products.router)
+app.include_router(cart.router)
 
 @app.on_event("startup")
 async def startup_event():
@@ -44,6 +100,18 @@ async def startup_event():
     if not os.path.exists("database/categories.json"):
         with open("database/categories.json", "w") as f:
             f.write("[]")
+    # Счетчики ID сверяются с данными один раз при старте
+    recover_id_sequences()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Дописываем на диск изменения, которые еще ждут группового коммита."""
+    flush_all_db()
+
+@app.get("/metrics", tags=["Root"], include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
 
 @app.get("/", tags=["Root"])
 async def read_root():
@@ -0,0 +1,187 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Операции хранилища бывают на порядки короче HTTP-запроса
+STORAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Сэмпл от коллектора: (имя метрики, тип, описание, метки, значение)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels: Iterable[Tuple[str, Any]]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+# --- Метрики в формате Prometheus ---
+class Metric:
+    """Метрика с фиксированным набором меток; значения хранятся по кортежу значений меток."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Tuple[Any, ...]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получено {labels}")
+        return tuple(str(label) for label in labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}"
+                for key, value in self._values.items()
+            ]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: Any, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labels: Any, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels: Any, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    """Гистограмма: счетчики по корзинам (в тексте - накопительные), сумма и число наблюдений."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, *labels: Any):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+class Registry:
+    """Набор метрик и коллекторов, которые снимают значения (например, счетчики кэша) в момент выдачи /metrics."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        described = set()
+        for collector in self._collectors:
+            for name, metric_type, documentation, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name}{_format_labels(labels.items())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Тип содержимого текстового формата Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Метрики приложения ---
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса по шаблону маршрута и статусу.",
+    ("method", "route", "status"),
+))
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "Запросы, которые обрабатываются прямо сейчас.", ("method",),
+))
+STORAGE_OPERATION_DURATION = REGISTRY.register(Histogram(
+    "storage_operation_duration_seconds",
+    "Время операций хранилища: read - запрос к базе, parse - потоковое чтение и разбор снапшота, "
+    "replay - проигрывание журнала, validate - создание моделей, serialize - подготовка записи, "
+    "write - запись на диск, compact - запись снапшота при компактации журнала.",
+    ("engine", "collection", "operation"), STORAGE_BUCKETS,
+))
+WRITE_BEHIND_LAG = REGISTRY.register(Histogram(
+    "storage_write_behind_lag_seconds",
+    "Сколько самое старое отложенное (write-behind) изменение пакета ждало записи на диск.",
+    ("collection",),
+))
+PASSWORD_HASH_DURATION = REGISTRY.register(Histogram(
+    "password_hash_duration_seconds", "Время bcrypt вместе с ожиданием свободного воркера пула.", ("operation",),
+))
+
+def storage_timer(engine: str, collection: str, operation: str):
+    """Контекстный менеджер, замеряющий одну операцию хранилища."""
+    return STORAGE_OPERATION_DURATION.time(engine, collection, operation)
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -1,16 +1,19 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 
 # Определяем возможные роли пользователей
 Role = Literal["admin", "worker", "customer"]
 
+# Наибольший остаток: столько помещается в 64-битные колонки аналитики и в INTEGER SQLite
+MAX_QUANTITY = 2 ** 63 - 1
+
 # --- МОДЕЛИ ТОВАРОВ ---
 class ProductBase(BaseModel):
     name: str
     description: str
     price: float
     category: str
-    quantity: int = Field(..., ge=0)
+    quantity: int = Field(..., ge=0, le=MAX_QUANTITY)
 
 class ProductCreate(ProductBase):
     pass
@@ -23,7 +26,7 @@ class ProductUpdate(BaseModel):
     description: Optional[str] = None
     price: Optional[float] = None
     category: Optional[str] = None
-    quantity: Optional[int] = None
+    quantity: Optional[int] = Field(None, le=MAX_QUANTITY)
 
 class QuantityUpdate(BaseModel):
     change: int
@@ -31,6 +34,49 @@ class QuantityUpdate(BaseModel):
 class ProductPurchase(BaseModel):
     quantity: int = Field(1, gt=0)
 
+class ProductBulkUpdate(ProductUpdate):
+    id: str
+
+class ProductBulkRequest(BaseModel):
+    create: List[ProductCreate] = []
+    update: List[ProductBulkUpdate] = []
+
+class ProductBulkResult(BaseModel):
+    created: List[Product]
+    updated: List[Product]
+
+# --- МОДЕЛИ АНАЛИТИКИ СКЛАДА ---
+class CategoryStats(BaseModel):
+    category: str
+    products: int
+    quantity: int
+    inventory_value: float
+    min_price: float
+    max_price: float
+    median_price: float
+
+class LowStockItem(BaseModel):
+    id: str
+    name: str
+    category: str
+    quantity: int
+
+class InventoryStats(BaseModel):
+    products: int
+    quantity: int
+    inventory_value: float
+    categories: List[CategoryStats]
+    low_stock_threshold: int
+    low_stock_count: int
+    low_stock: List[LowStockItem]
+
+# --- МОДЕЛИ КОРЗИНЫ ---
+class CartLine(ProductPurchase):
+    product_id: str
+
+class CartCheckout(BaseModel):
+    items: List[CartLine] = Field(..., min_length=1)
+
 # --- МОДЕЛИ ПОЛЬЗОВАТЕЛЕЙ ---
 
 class UserBase(BaseModel):
@@ -82,3 +128,15 @@ class UserSearch(BaseModel):
     id: Optional[str] = None
     username: Optional[str] = None
     role: Optional[Role] = None
+
+# --- Модели постраничного вывода ---
+
+ProductSortField = Literal["price", "name", "id", "quantity"]
+
+class PageParams(BaseModel):
+    limit: Optional[int] = None
+    offset: int = 0
+    cursor: Optional[str] = None
+    sort: Optional[ProductSortField] = None
+    order: Literal["asc", "desc"] = "asc"
+    format: Literal["json", "ndjson"] = "json"
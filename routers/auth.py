@@ -3,48 +3,54 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 
 from models.models import UserCreate, UserPublic, Token, Role
-from database.db import get_all_users_db, save_all_users_db, find_user_by_username, generate_new_id, UserInDB
-from security.security import get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, verify_password
+from database.db import add_user_db, find_user_by_username, next_user_id, wait_for_commit, UserInDB
+from security.security import get_password_hash_async, invalidate_cached_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, verify_password_async
 
 router = APIRouter(prefix="/api", tags=["Authentication"])
 
-def register_user(user_data: UserCreate, role: Role, id_prefix: str):
-    """Общая функция для регистрации пользователя."""
-    if find_user_by_username(user_data.username):
+def ensure_username_is_free(username: str):
+    if find_user_by_username(username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this username already exists"
         )
+
+async def register_user(user_data: UserCreate, role: Role, id_prefix: str):
+    """Общая функция для регистрации пользователя."""
+    ensure_username_is_free(user_data.username)
     
-    users = get_all_users_db()
+    hashed_password = await get_password_hash_async(user_data.password)
+    # Пока считался хеш, это имя мог занять параллельный запрос
+    ensure_username_is_free(user_data.username)
     
     new_user = UserInDB(
-        id=generate_new_id(id_prefix, [u.model_dump() for u in users]),
+        id=next_user_id(id_prefix),
         username=user_data.username,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         role=role
     )
     
-    users.append(new_user)
-    save_all_users_db(users)
+    commit = add_user_db(new_user)
+    invalidate_cached_user(new_user.username)
+    await wait_for_commit(commit)
     return UserPublic(id=new_user.id, username=new_user.username, role=new_user.role)
 
 @router.post("/admin-reg", response_model=UserPublic, status_code=status.HTTP_201_CREATED)
 async def register_admin_user(user: UserCreate):
-    return register_user(user, "admin", "a")
+    return await register_user(user, "admin", "a")
 
 @router.post("/worker-reg", response_model=UserPublic, status_code=status.HTTP_201_CREATED)
 async def register_worker_user(user: UserCreate):
-    return register_user(user, "worker", "w")
+    return await register_user(user, "worker", "w")
 
 @router.post("/customer-reg", response_model=UserPublic, status_code=status.HTTP_201_CREATED)
 async def register_customer_user(user: UserCreate):
-    return register_user(user, "customer", "c")
+    return await register_user(user, "customer", "c")
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     user = find_user_by_username(form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -0,0 +1,41 @@
+from typing import Dict, List
+from fastapi import APIRouter, Depends, HTTPException, status
+from models.models import CartCheckout, Product, UserInDB
+from database.db import purchase_products_db, wait_for_commit, InsufficientStock, RecordNotFound
+from security.security import get_current_active_user
+from utils.events import publish_stock_change
+
+router = APIRouter(prefix="/api", tags=["Cart"])
+
+@router.post("/cart/checkout", response_model=List[Product])
+async def checkout_cart(
+    cart: CartCheckout,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Покупка всей корзины одним запросом. Остатки проверяются и списываются атомарно:
+    если хотя бы одного товара не хватает, не покупается ничего.
+    Возвращает товары корзины с новыми остатками.
+    """
+    if current_user.role != "customer":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only customers can purchase products")
+
+    # Повторяющиеся строки одного товара складываются
+    quantities: Dict[str, int] = {}
+    for line in cart.items:
+        quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+
+    try:
+        purchased_products, commit = purchase_products_db(list(quantities.items()))
+    except RecordNotFound as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product {exc.key} not found")
+    except InsufficientStock as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Not enough items in stock for product {exc.product_id}. Available: {exc.available}."
+        )
+
+    for product in purchased_products:
+        publish_stock_change(product)
+    await wait_for_commit(commit)
+    return purchased_products
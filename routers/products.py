@@ -1,8 +1,18 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Form 
-from models.models import ProductUpdate, Product, ProductCreate, ProductPurchase, UserInDB, Category, CategoryCreate, QuantityUpdate, ProductSearch
-from database.db import get_all_products_db, save_all_products_db, generate_new_id, get_all_categories_db, save_all_categories_db
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from models.models import ProductUpdate, Product, ProductCreate, ProductPurchase, UserInDB, Category, CategoryCreate, QuantityUpdate, ProductSearch, PageParams, ProductBulkRequest, ProductBulkResult, InventoryStats
+from database.db import (
+    get_all_products_db, next_product_id, next_product_ids, get_all_categories_db, find_category_db, add_category_db,
+    find_product_by_id, add_product_db, update_product_fields_db, change_product_quantity_db, bulk_write_products_db,
+    delete_product_db, search_products_db, products_by_category_db, wait_for_commit, InsufficientStock, QuantityLimitExceeded, RecordNotFound,
+    products_version_db, product_version_db, categories_version_db, inventory_stats_db, LOW_STOCK_THRESHOLD
+)
 from security.security import get_worker_user, get_current_active_user
+from utils.pagination import MAX_PAGE_SIZE, get_page_params, paginated_response
+from utils.etag import make_etag, is_not_modified, not_modified_response
+from utils.response_cache import cached_json, cached_page
+from utils.events import product_events, publish_product_change, publish_stock_change, publish_product_deleted
 
 router = APIRouter(prefix="/api", tags=["Products"])
 
@@ -13,54 +23,132 @@ async def create_category(
     current_user: UserInDB = Depends(get_worker_user)
 ):
     """Создание новой категории товаров (только для админов и работников)."""
-    categories = get_all_categories_db()
-    
-    if any(cat.name.lower() == category_data.name.lower() for cat in categories):
+    if find_category_db(category_data.name):
         raise HTTPException(status_code=400, detail="Category with this name already exists")
     
     new_category = Category(name=category_data.name)
     
-    categories.append(new_category)
-    save_all_categories_db(categories)
+    await wait_for_commit(add_category_db(new_category))
     return new_category
 
 @router.get("/products/category/", response_model=List[Category])
 async def get_all_categories(
+    request: Request,
+    response: Response,
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """Получение списка всех созданных категорий."""
-    return get_all_categories_db()
+    # Версию берем до чтения данных: если между ними пройдет запись, ETag окажется старее данных, а не наоборот
+    version = categories_version_db()
+    etag = make_etag("categories", version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    return cached_json("categories", version, "", get_all_categories_db, response)
 
 @router.get("/products/category/{category_name}", response_model=List[Product])
 async def get_products_by_category(
     category_name: str, 
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(get_page_params),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    """Получение списка товаров по названию категории."""
-    products = get_all_products_db()
-    
-    filtered_products = [
-        p for p in products if p.category.lower() == category_name.lower()
-    ]
-    
-    return filtered_products
+    """Получение списка товаров по названию категории (с пагинацией и сортировкой)."""
+    version = products_version_db()
+    etag = make_etag("products", version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    return cached_page(f"category:{category_name.lower()}", version, lambda: products_by_category_db(category_name), page, response)
 
 # --- Эндпоинты для Товаров ---
 
 @router.get("/products/", response_model=List[Product])
-async def get_all_products(current_user: UserInDB = Depends(get_current_active_user)):
-    """Все пользователи могут просматривать список товаров."""
-    return get_all_products_db()
+async def get_all_products(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(get_page_params),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Все пользователи могут просматривать список товаров.
+    Поддерживает limit/offset/cursor, сортировку (sort, order) и потоковый вывод format=ndjson;
+    курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    Ответ помечается ETag; при совпадающем If-None-Match возвращается 304 без чтения каталога.
+    """
+    # ETag зависит только от версии каталога: при тех же query-параметрах ответ тот же
+    version = products_version_db()
+    etag = make_etag("products", version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    # Готовая страница берется из кэша ответов, пока версия каталога не изменилась
+    return cached_page("products", version, get_all_products_db, page, response)
+
+# Объявлен до /products/{product_id}, иначе "events" попадет в product_id
+@router.get("/products/events")
+async def product_change_events(
+    last_event_id: Optional[str] = Header(None),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Поток Server-Sent Events об изменениях товаров вместо опроса списка и карточек:
+    create и update (товар целиком), stock (id и новый остаток), delete (id)
+    и reset (клиент пропустил события и должен перечитать данные).
+    Переподключение с заголовком Last-Event-ID продолжает поток с пропущенного события.
+    """
+    return StreamingResponse(
+        product_events.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/products/stats", response_model=InventoryStats)
+async def get_inventory_stats(
+    request: Request,
+    response: Response,
+    low_stock_threshold: int = Query(LOW_STOCK_THRESHOLD, ge=0),
+    low_stock_limit: int = Query(100, ge=0, le=MAX_PAGE_SIZE),
+    current_user: UserInDB = Depends(get_worker_user)
+):
+    """
+    Сводка по складу (только для админов и работников): число товаров и штук, стоимость остатков,
+    по категориям - то же плюс минимальная, максимальная и медианная цена, и товары
+    с остатком не больше low_stock_threshold (самые дефицитные первыми).
+    Считается одним векторным проходом по колоночному представлению каталога.
+    """
+    version = products_version_db()
+    etag = make_etag("stats", version, str(low_stock_threshold), str(low_stock_limit))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    return cached_json("stats", version, f"{low_stock_threshold}:{low_stock_limit}",
+                       lambda: inventory_stats_db(low_stock_threshold, low_stock_limit), response)
 
 @router.get("/products/{product_id}", response_model=Product)
-async def get_product_by_id(product_id: str, current_user: UserInDB = Depends(get_current_active_user)):
+async def get_product_by_id(
+    product_id: str,
+    request: Request,
+    response: Response,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
     """Получение одного товара по его ID."""
-    products = get_all_products_db()
-    product = next((p for p in products if p.id == product_id), None)
-    
-    if not product:
+    version = product_version_db(product_id)
+    etag = make_etag("product", product_id, version) if version else None
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    if version is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    return product
+    response.headers["ETag"] = etag
+
+    def render() -> Product:
+        product = find_product_by_id(product_id)
+        if not product:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+        return product
+    return cached_json(f"product:{product_id}", version, "", render, response)
 
 @router.post("/products/", response_model=Product, status_code=status.HTTP_201_CREATED)
 async def create_product(
@@ -68,22 +156,67 @@ async def create_product(
     current_user: UserInDB = Depends(get_worker_user)
 ):
     """Добавление нового товара."""
-    categories = get_all_categories_db()
-    if not any(cat.name.lower() == product_data.category.lower() for cat in categories):
+    if not find_category_db(product_data.category):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Category '{product_data.category}' does not exist."
         )
 
-    products = get_all_products_db()
     new_product = Product(
-        id=generate_new_id("p", [p.model_dump() for p in products]),
+        id=next_product_id(),
         **product_data.model_dump()
     )
-    products.append(new_product)
-    save_all_products_db(products)
+    commit = add_product_db(new_product)
+    publish_product_change("create", new_product)
+    await wait_for_commit(commit)
     return new_product
 
+@router.post("/products/bulk", response_model=ProductBulkResult)
+async def bulk_products(
+    bulk: ProductBulkRequest,
+    current_user: UserInDB = Depends(get_worker_user)
+):
+    """
+    Пакетное создание и редактирование товаров за один запрос.
+    Сначала проверяется весь пакет, затем все изменения сохраняются одной записью:
+    при любой ошибке не применяется ни одно из них.
+    """
+    categories = {item.category for item in bulk.create}
+    categories.update(item.category for item in bulk.update if item.category is not None)
+    for category in categories:
+        if not find_category_db(category):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Category '{category}' does not exist."
+            )
+
+    updates = []
+    for item in bulk.update:
+        update_data = item.model_dump(exclude_none=True, exclude={"id"})
+        if "quantity" in update_data and update_data["quantity"] < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Product quantity cannot be negative (product {item.id})."
+            )
+        updates.append((item.id, update_data))
+
+    new_products = []
+    if bulk.create:
+        new_ids = next_product_ids(len(bulk.create))
+        new_products = [Product(id=product_id, **item.model_dump()) for product_id, item in zip(new_ids, bulk.create)]
+
+    try:
+        updated_products, commit = bulk_write_products_db(new_products, updates)
+    except RecordNotFound as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product {exc.key} not found")
+
+    for product in new_products:
+        publish_product_change("create", product)
+    for product in updated_products:
+        publish_product_change("update", product)
+    await wait_for_commit(commit)
+    return ProductBulkResult(created=new_products, updated=updated_products)
+
 @router.put("/products/{product_id}/update-quantity", response_model=Product)
 async def update_product_quantity(
     product_id: str, 
@@ -91,33 +224,31 @@ async def update_product_quantity(
     current_user: UserInDB = Depends(get_worker_user)
 ):
     """Изменение количества товара."""
-    products = get_all_products_db()
-    product_to_update = next((p for p in products if p.id == product_id), None)
-    if not product_to_update:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-
-    new_quantity = product_to_update.quantity + quantity_update.change
-    if new_quantity < 0:
+    try:
+        updated_product, commit = change_product_quantity_db(product_id, quantity_update.change)
+    except InsufficientStock:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Product quantity cannot be negative."
         )
-    
-    product_to_update.quantity = new_quantity
-    save_all_products_db(products)
-    return product_to_update
+    except QuantityLimitExceeded as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    if not updated_product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+    publish_stock_change(updated_product)
+    await wait_for_commit(commit)
+    return updated_product
 
 @router.delete("/products/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_product(product_id: str, current_user: UserInDB = Depends(get_worker_user)):
     """Удаление товара."""
-    products = get_all_products_db()
-    product_to_delete = next((p for p in products if p.id == product_id), None)
+    commit = delete_product_db(product_id)
     
-    if not product_to_delete:
+    if not commit:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-        
-    products.remove(product_to_delete)
-    save_all_products_db(products)
+    publish_product_deleted(product_id)
+    await wait_for_commit(commit)
     return
 
 @router.post("/products/{product_id}/purchase", response_model=Product)
@@ -130,22 +261,21 @@ async def purchase_product(
     if current_user.role != "customer":
          raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only customers can purchase products")
 
-    products = get_all_products_db()
-    product_to_purchase = next((p for p in products if p.id == product_id), None)
-
-    if not product_to_purchase:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-
-    if product_to_purchase.quantity < purchase.quantity:
+    # Проверка остатка и списание выполняются атомарно под локом коллекции
+    try:
+        purchased_product, commit = change_product_quantity_db(product_id, -purchase.quantity)
+    except InsufficientStock as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Not enough items in stock. Available: {product_to_purchase.quantity}."
+            detail=f"Not enough items in stock. Available: {exc.available}."
         )
-    
-    product_to_purchase.quantity -= purchase.quantity
-    save_all_products_db(products)
-    
-    return product_to_purchase
+
+    if not purchased_product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+    publish_stock_change(purchased_product)
+    await wait_for_commit(commit)
+    return purchased_product
 
 # --- Эндпоинты для РЕДАКТИРОВАНИЯ ---
 
@@ -156,8 +286,7 @@ async def edit_product(
     current_user: UserInDB = Depends(get_worker_user)
 ):
     """Основной эндпоинт редактирования данных товара (JSON)."""
-    products = get_all_products_db()
-    product_to_edit = next((p for p in products if p.id == product_id), None)
+    product_to_edit = find_product_by_id(product_id)
 
     if not product_to_edit:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
@@ -166,8 +295,7 @@ async def edit_product(
 
     # Проверку категории проводим только если она есть в данных для обновления
     if "category" in update_data:
-        categories = get_all_categories_db()
-        if not any(cat.name.lower() == update_data["category"].lower() for cat in categories):
+        if not find_category_db(update_data["category"]):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Category '{update_data['category']}' does not exist."
@@ -180,11 +308,14 @@ async def edit_product(
             detail="Product quantity cannot be negative."
         )
 
-    for key, value in update_data.items():
-        setattr(product_to_edit, key, value)
+    # Поля применяются к текущей версии товара атомарно, не затирая параллельные изменения остатка
+    edited_product, commit = update_product_fields_db(product_id, update_data)
+    if not edited_product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
-    save_all_products_db(products)
-    return product_to_edit
+    publish_product_change("update", edited_product)
+    await wait_for_commit(commit)
+    return edited_product
 
 def get_product_update_from_form(
     name: Optional[str] = Form(None),
@@ -218,54 +349,13 @@ async def edit_product_form(
 @router.post("/products/search", response_model=List[Product])
 async def search_products(
     search_criteria: ProductSearch,
+    response: Response,
+    page: PageParams = Depends(get_page_params),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """
     Поиск товаров по критериям (название, категория, диапазон цен).
     Доступен всем авторизованным пользователям.
     """
-    products = get_all_products_db()
-
-    # Если передан параметр "search", фильтруем по названию, описанию и категории.
-    if search_criteria.search:
-        search_term = search_criteria.search.lower()
-        products = [
-            p for p in products if
-            search_term in p.name.lower() or
-            search_term in p.id.lower() or
-            search_term in p.description.lower() or
-            search_term in p.category.lower()
-        ]
-    
-    # Применяем фильтры последовательно
-    if search_criteria.name:
-        products = [
-            p for p in products 
-            if search_criteria.name.lower() in p.name.lower()
-        ]
-
-    if search_criteria.id:
-        products = [
-            p for p in products 
-            if search_criteria.id.lower() in p.id.lower()
-        ]
-    
-    if search_criteria.category:
-        products = [
-            p for p in products 
-            if search_criteria.category.lower() in p.category.lower()
-        ]
-        
-    if search_criteria.min_price is not None:
-        products = [
-            p for p in products 
-            if p.price >= search_criteria.min_price
-        ]
-        
-    if search_criteria.max_price is not None:
-        products = [
-            p for p in products 
-            if p.price <= search_criteria.max_price
-        ]
-        
-    return products
+    # Кандидаты берутся из самого селективного индекса (цены или триграмм), остальные фильтры проверяются на них
+    return paginated_response(search_products_db(search_criteria), page, response)
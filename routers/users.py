@@ -1,28 +1,30 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from models.models import UserPublic, UserInDB, UserSearch
-from database.db import get_all_users_db, save_all_users_db, find_user_by_id
-from security.security import get_admin_user, get_worker_user, get_current_active_user
+from database.db import get_all_users_db, users_version_db, find_user_by_id, delete_user_db, wait_for_commit
+from security.security import get_admin_user, get_worker_user, get_current_active_user, invalidate_cached_user
+from utils.response_cache import cached_json
 
 router = APIRouter(prefix="/api", tags=["Users"])
 
 @router.get("/user/", response_model=List[UserPublic])
-async def read_users(current_user: UserInDB = Depends(get_current_active_user)):
+async def read_users(response: Response, current_user: UserInDB = Depends(get_current_active_user)):
     """
     Получение списка пользователей в зависимости от роли:
     """
-    users = get_all_users_db()
-    
-    if current_user.role == "admin":
-        return [UserPublic.model_validate(user.model_dump()) for user in users]
-    
-    if current_user.role == "worker":
+    if current_user.role not in ("admin", "worker"):
+        # Покупателям доступ запрещен
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+
+    def render() -> List[UserPublic]:
+        users = get_all_users_db()
+        if current_user.role == "admin":
+            return [UserPublic.model_validate(user.model_dump()) for user in users]
         filtered_users = [user for user in users if user.role in ["worker", "customer"]]
         return [UserPublic.model_validate(u.model_dump()) for u in filtered_users]
 
-        
-    # Покупателям доступ запрещен
-    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    # Админ и работник видят разные списки, поэтому роль - часть ключа кэша
+    return cached_json("users", users_version_db(), current_user.role, render, response)
 
 @router.get("/user/{user_id}", response_model=UserPublic)
 async def read_user(user_id: str, current_user: UserInDB = Depends(get_current_active_user)):
@@ -51,7 +53,6 @@ async def delete_user(user_id: str, current_user: UserInDB = Depends(get_current
     - Админ: может удалить любого.
     - Работник: может удалить только покупателя.
     """
-    users = get_all_users_db()
     user_to_delete = find_user_by_id(user_id)
 
     if not user_to_delete:
@@ -70,8 +71,10 @@ async def delete_user(user_id: str, current_user: UserInDB = Depends(get_current
     if not can_delete:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions to delete this user")
         
-    users_after_deletion = [user for user in users if user.id != user_id]
-    save_all_users_db(users_after_deletion)
+    commit = delete_user_db(user_id)
+    invalidate_cached_user(user_to_delete.username)
+    if commit:
+        await wait_for_commit(commit)
     return
 
 @router.post("/user/search", response_model=List[UserPublic])
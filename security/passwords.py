@@ -0,0 +1,11 @@
+from passlib.context import CryptContext
+
+# Отдельный модуль без импорта базы: его функции выполняются в процессах пула bcrypt,
+# а запущенный через spawn процесс импортирует модуль вызываемой функции заново
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
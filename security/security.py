@@ -1,15 +1,22 @@
+import asyncio
+import multiprocessing
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Set, Tuple
 from dotenv import load_dotenv
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 from models.models import UserInDB, TokenData, Role
-from database.db import find_user_by_username
+# verify_password, get_password_hash и pwd_context по-прежнему доступны из security.security
+from security.passwords import get_password_hash, pwd_context, verify_password
+from database.db import find_user_by_username, shared_state
+from metrics.metrics import PASSWORD_HASH_DURATION
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
@@ -18,19 +25,57 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256") # "HS256" как значение по умолчанию
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 420))
+# Пул для bcrypt: "thread" или "process" и число воркеров
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+# Кэш пользователей по токену: максимум записей и время жизни записи в секундах
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
 
 # Проверка, что SECRET_KEY установлен
 if SECRET_KEY is None:
     raise ValueError("Необходимо установить SECRET_KEY в .env файле")
 
-# --- Утилиты для работы с паролями ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# --- Асинхронные обертки над bcrypt ---
+# Один раунд bcrypt занимает сотни миллисекунд, поэтому в async-роутах он выполняется
+# в отдельном ограниченном пуле, а не блокирует цикл событий.
+def _create_password_executor() -> Executor:
+    if PASSWORD_HASH_EXECUTOR == "process":
+        # spawn, а не fork: к этому моменту уже есть потоки-писатели коллекций и локи лимитера,
+        # и дочерний процесс мог бы унаследовать их захваченными
+        return ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+_password_executor = _create_password_executor()
+# Сколько операций сейчас ждут свободного воркера или выполняются
+_password_queue_depth = 0
+_password_queue_depth_max = 0
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def _run_password_task(func: Callable[..., Any], *args: Any) -> Any:
+    global _password_queue_depth, _password_queue_depth_max
+    _password_queue_depth += 1
+    _password_queue_depth_max = max(_password_queue_depth_max, _password_queue_depth)
+    try:
+        loop = asyncio.get_running_loop()
+        with PASSWORD_HASH_DURATION.time(func.__name__):
+            return await loop.run_in_executor(_password_executor, func, *args)
+    finally:
+        _password_queue_depth -= 1
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_task(get_password_hash, password)
+
+def get_password_pool_stats() -> Dict[str, Any]:
+    """Метрики пула хеширования паролей."""
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "queue_depth": _password_queue_depth,
+        "queue_depth_max": _password_queue_depth_max,
+    }
 
 # --- Утилиты для JWT токенов ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
@@ -45,9 +90,67 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# --- Зависимости (остальная часть файла остается без изменений) ---
+# --- Кэш аутентифицированных пользователей ---
+# token -> (пользователь, момент истечения записи). Запись живет не дольше TTL и не дольше exp токена.
+_principal_cache: "OrderedDict[str, Tuple[UserInDB, float]]" = OrderedDict()
+# username -> токены этого пользователя в кэше, чтобы инвалидировать их без полного обхода
+_principal_tokens: Dict[str, Set[str]] = {}
+
+def _get_cached_principal(token: str) -> Optional[UserInDB]:
+    entry = _principal_cache.get(token)
+    if entry is None:
+        return None
+    user, expires_at = entry
+    if expires_at <= time.time():
+        _drop_cached_token(token)
+        return None
+    _principal_cache.move_to_end(token)
+    return user
+
+def _cache_principal(token: str, user: UserInDB, token_exp: Optional[float]):
+    expires_at = time.time() + PRINCIPAL_CACHE_TTL_SECONDS
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    _principal_cache[token] = (user, expires_at)
+    _principal_cache.move_to_end(token)
+    _principal_tokens.setdefault(user.username, set()).add(token)
+    while len(_principal_cache) > PRINCIPAL_CACHE_SIZE:
+        oldest_token = next(iter(_principal_cache))
+        _drop_cached_token(oldest_token)
+
+def _drop_cached_token(token: str):
+    user, _ = _principal_cache.pop(token)
+    tokens = _principal_tokens.get(user.username)
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del _principal_tokens[user.username]
+
+def _drop_cached_user(username: str):
+    for token in list(_principal_tokens.get(username, ())):
+        _drop_cached_token(token)
+
+def invalidate_cached_user(username: str):
+    """
+    Убирает из кэша все токены пользователя (удаление, повторная регистрация, смена роли).
+    С несколькими воркерами инвалидация рассылается и остальным процессам через общее состояние.
+    """
+    _drop_cached_user(username)
+    if shared_state is not None:
+        shared_state.publish("user", username)
+
+if shared_state is not None:
+    shared_state.subscribe("user", _drop_cached_user)
+
+# --- Зависимости ---
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
-    # ... (код без изменений)
+    if shared_state is not None:
+        # Сначала применяем инвалидации от других воркеров, чтобы не отдать удаленного пользователя
+        shared_state.sync()
+    cached_user = _get_cached_principal(token)
+    if cached_user is not None:
+        return cached_user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -65,6 +168,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
     user = find_user_by_username(username=token_data.username)
     if user is None:
         raise credentials_exception
+    _cache_principal(token, user, payload.get("exp"))
     return user
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# database.db создает движок при импорте: тесты работают с отдельной базой SQLite
+# во временном каталоге, а не с файлами в database/
+_data_dir = tempfile.mkdtemp(prefix="techmart-tests-")
+os.environ.setdefault("DB_ENGINE", "sqlite")
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(_data_dir, "techmart.sqlite3"))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
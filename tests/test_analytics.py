@@ -0,0 +1,36 @@
+from database.analytics import ProductColumns
+from models.models import MAX_QUANTITY, Product
+
+def make_product(product_id: str, category: str, quantity: int, price: float = 1.0) -> Product:
+    return Product(id=product_id, name=product_id, description="", price=price, category=category, quantity=quantity)
+
+def test_quantity_sums_are_exact_at_max_quantity():
+    columns = ProductColumns()
+    products = [
+        make_product("p1", "Laptops", MAX_QUANTITY),
+        make_product("p2", "laptops", MAX_QUANTITY),
+        make_product("p3", "Phones", 2 ** 53 + 1),
+        make_product("p4", "Phones", 1),
+    ]
+    for product in products:
+        columns.add(product.id, product)
+
+    stats = columns.inventory_stats(low_stock_threshold=0, low_stock_limit=10)
+
+    assert stats.quantity == 2 * MAX_QUANTITY + 2 ** 53 + 2
+    by_category = {category.category: category for category in stats.categories}
+    assert by_category["Laptops"].products == 2
+    assert by_category["Laptops"].quantity == 2 * MAX_QUANTITY
+    assert by_category["Phones"].quantity == 2 ** 53 + 2
+
+def test_removed_products_drop_out_of_stats():
+    columns = ProductColumns()
+    for product in (make_product("p1", "Laptops", 2, 10.0), make_product("p2", "Laptops", 0, 30.0)):
+        columns.add(product.id, product)
+    columns.remove("p2", None)
+
+    stats = columns.inventory_stats(low_stock_threshold=5, low_stock_limit=10)
+
+    assert stats.products == 1
+    assert stats.inventory_value == 20.0
+    assert [item.id for item in stats.low_stock] == ["p1"]
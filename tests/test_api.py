@@ -0,0 +1,170 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import database.db as db
+from database.json_engine import JsonStorageEngine
+from database.sqlite_engine import SqliteStorageEngine
+from main import app
+from models.models import UserInDB
+from security.security import get_current_user
+from utils.response_cache import response_cache
+
+@pytest.fixture(params=["json", "sqlite"])
+def engine(request, tmp_path, monkeypatch):
+    if request.param == "json":
+        engine = JsonStorageEngine(
+            users_path=str(tmp_path / "users.json"),
+            products_path=str(tmp_path / "products.json"),
+            categories_path=str(tmp_path / "categories.json"),
+            products_journal_path=str(tmp_path / "products.journal"),
+            sequences_path=str(tmp_path / "sequences.json"),
+            journal_compact_bytes=1024 * 1024,
+            group_commit_ms=0,
+        )
+    else:
+        engine = SqliteStorageEngine(str(tmp_path / "techmart.sqlite3"))
+    monkeypatch.setattr(db, "engine", engine)
+    # Версии новой базы могут совпасть с версиями из прошлого теста
+    response_cache.clear()
+    yield engine
+    engine.flush()
+
+@pytest.fixture
+def client(engine):
+    user = {"role": "worker"}
+    app.dependency_overrides[get_current_user] = lambda: UserInDB(
+        id="u1", username="tester", role=user["role"], hashed_password="",
+    )
+    client = TestClient(app)
+    client.role = lambda role: user.update(role=role)
+    response = client.post("/api/products/category/", json={"name": "Laptops"})
+    assert response.status_code == 201
+    yield client
+    app.dependency_overrides.clear()
+
+def create_product(client, price=100.0, quantity=5, name="Laptop"):
+    response = client.post("/api/products/", json={
+        "name": name, "description": "", "price": price, "category": "Laptops", "quantity": quantity,
+    })
+    assert response.status_code == 201
+    return response.json()
+
+def quantity_of(client, product_id):
+    return client.get(f"/api/products/{product_id}").json()["quantity"]
+
+# --- Корзина: все строки или ни одной ---
+def test_checkout_insufficient_stock_rolls_back_earlier_lines(client):
+    first = create_product(client, quantity=5)
+    second = create_product(client, quantity=1)
+    client.role("customer")
+    response = client.post("/api/cart/checkout", json={"items": [
+        {"product_id": first["id"], "quantity": 2},
+        {"product_id": second["id"], "quantity": 3},
+    ]})
+    assert response.status_code == 400
+    assert second["id"] in response.json()["detail"]
+    assert quantity_of(client, first["id"]) == 5
+    assert quantity_of(client, second["id"]) == 1
+
+def test_checkout_unknown_product_changes_nothing(client):
+    product = create_product(client, quantity=5)
+    client.role("customer")
+    response = client.post("/api/cart/checkout", json={"items": [
+        {"product_id": product["id"], "quantity": 1},
+        {"product_id": "missing", "quantity": 1},
+    ]})
+    assert response.status_code == 404
+    assert quantity_of(client, product["id"]) == 5
+
+def test_checkout_sums_repeated_lines(client):
+    first = create_product(client, quantity=5)
+    second = create_product(client, quantity=1)
+    client.role("customer")
+    response = client.post("/api/cart/checkout", json={"items": [
+        {"product_id": first["id"], "quantity": 2},
+        {"product_id": second["id"], "quantity": 1},
+        {"product_id": first["id"], "quantity": 1},
+    ]})
+    assert response.status_code == 200
+    assert {item["id"]: item["quantity"] for item in response.json()} == {first["id"]: 2, second["id"]: 0}
+    assert quantity_of(client, first["id"]) == 2
+
+# --- Пакетная запись ---
+def test_bulk_with_unknown_product_applies_nothing(client):
+    product = create_product(client, price=100.0)
+    response = client.post("/api/products/bulk", json={
+        "create": [{"name": "New", "description": "", "price": 1.0, "category": "Laptops", "quantity": 1}],
+        "update": [{"id": product["id"], "price": 50.0}, {"id": "missing", "price": 10.0}],
+    })
+    assert response.status_code == 404
+    assert "missing" in response.json()["detail"]
+    assert client.get(f"/api/products/{product['id']}").json()["price"] == 100.0
+    assert [item["id"] for item in client.get("/api/products/").json()] == [product["id"]]
+
+def test_bulk_applies_creates_and_updates(client):
+    product = create_product(client, price=100.0)
+    response = client.post("/api/products/bulk", json={
+        "create": [{"name": "New", "description": "", "price": 1.0, "category": "Laptops", "quantity": 1}],
+        "update": [{"id": product["id"], "price": 50.0}],
+    })
+    assert response.status_code == 200
+    result = response.json()
+    assert [item["price"] for item in result["updated"]] == [50.0]
+    assert len(client.get("/api/products/").json()) == 2
+
+# --- Курсорная пагинация ---
+def test_cursor_pages_are_stable_under_inserts(client):
+    originals = [create_product(client, price=float(10 + number % 3))["id"] for number in range(7)]
+    params = {"limit": 3, "sort": "price"}
+    response = client.get("/api/products/", params=params)
+    seen = [item["id"] for item in response.json()]
+    # Товар, который встает перед курсором, не сдвигает следующие страницы
+    inserted = create_product(client, price=1.0)["id"]
+    while "X-Next-Cursor" in response.headers:
+        response = client.get("/api/products/", params={**params, "cursor": response.headers["X-Next-Cursor"]})
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in response.json())
+    assert sorted(seen) == sorted(originals)
+    assert inserted not in seen
+
+def test_invalid_cursor_is_rejected(client):
+    create_product(client)
+    response = client.get("/api/products/", params={"limit": 1, "sort": "price", "cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid pagination cursor"
+
+# --- ETag и 304 ---
+def test_product_list_not_modified_until_catalog_changes(client):
+    product = create_product(client)
+    response = client.get("/api/products/")
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get("/api/products/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    client.patch(f"/api/products/{product['id']}", json={"price": 1.0})
+    response = client.get("/api/products/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["price"] == 1.0
+
+def test_product_etag_changes_on_purchase(client):
+    product = create_product(client, quantity=5)
+    etag = client.get(f"/api/products/{product['id']}").headers["ETag"]
+    # Слабое сравнение: тот же тег без W/ и в списке тоже подходит
+    strong = etag[2:]
+    response = client.get(f"/api/products/{product['id']}", headers={"If-None-Match": f'"other", {strong}'})
+    assert response.status_code == 304
+
+    client.role("customer")
+    assert client.post(f"/api/products/{product['id']}/purchase", json={"quantity": 1}).status_code == 200
+    response = client.get(f"/api/products/{product['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 4
+
+def test_missing_product_is_not_reported_as_not_modified(client):
+    response = client.get("/api/products/missing", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from database.shared_state import SharedState
+from utils.events import EventBroker
+
+@pytest.fixture
+def workers(tmp_path):
+    # Два воркера: у каждого свое соединение с общим файлом и свой брокер
+    path = str(tmp_path / "shared.sqlite3")
+    brokers = []
+    for _ in range(2):
+        broker = EventBroker(backlog_size=10, queue_size=10, channel="product_event")
+        broker.use_relay(SharedState(path))
+        brokers.append(broker)
+    return brokers
+
+async def read_events(broker, count, last_event_id=None):
+    messages = []
+    stream = broker.stream(last_event_id, keepalive_seconds=0.05)
+    try:
+        while len(messages) < count:
+            message = await asyncio.wait_for(stream.__anext__(), 5)
+            if not message.startswith(":"):
+                messages.append(message)
+    finally:
+        await stream.aclose()
+    return messages
+
+def test_event_published_by_one_worker_reaches_subscribers_of_another(workers):
+    first, second = workers
+
+    async def scenario():
+        reader = asyncio.create_task(read_events(second, 1))
+        await asyncio.sleep(0.1)
+        first.publish("stock", {"id": "p1", "quantity": 3})
+        return await reader
+
+    [message] = asyncio.run(scenario())
+    assert "event: stock\n" in message
+    assert '"quantity":3' in message
+
+def test_last_event_id_resumes_on_another_worker(workers):
+    first, second = workers
+    first.publish("stock", {"id": "p1", "quantity": 1})
+    first.publish("stock", {"id": "p1", "quantity": 2})
+    first.publish("delete", {"id": "p1"})
+    first_id = first._backlog[0][1].split("\n")[0][len("id: "):]
+
+    messages = asyncio.run(read_events(second, 2, last_event_id=first_id))
+    assert ["event: stock" in messages[0], "event: delete" in messages[1]] == [True, True]
+    assert '"quantity":2' in messages[0]
+
+def test_events_are_not_duplicated_on_the_publishing_worker(workers):
+    first, _ = workers
+    first.publish("stock", {"id": "p1", "quantity": 1})
+    first._relay.sync()
+    assert first.published == 1
+    assert len(first._backlog) == 1
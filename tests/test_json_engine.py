@@ -0,0 +1,49 @@
+import errno
+import os
+
+from database import json_engine
+from database.json_engine import JournaledCollection
+from models.models import Product
+
+def make_collection(tmp_path) -> JournaledCollection:
+    # Большой интервал группового коммита: писатель не успеет вмешаться, flush вызывает сам тест
+    return JournaledCollection(
+        str(tmp_path / "products.json"), Product, key="id",
+        journal_path=str(tmp_path / "products.journal"),
+        compact_threshold=1024 * 1024, group_commit_ms=60000,
+    )
+
+def make_product(product_id: str) -> Product:
+    return Product(id=product_id, name=f"Product {product_id}", description="", price=10.0, category="Laptops", quantity=1)
+
+def test_failed_journal_write_is_truncated_and_retried(tmp_path, monkeypatch):
+    collection = make_collection(tmp_path)
+    first_commit = collection.insert(make_product("p1"))
+
+    real_write = os.write
+    failures = []
+
+    def write_half_then_fail(fd, data):
+        # Имитируем кончившееся место: половина пакета попала в файл, затем ENOSPC
+        if not failures:
+            failures.append(fd)
+            real_write(fd, data[:len(data) // 2])
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return real_write(fd, data)
+
+    monkeypatch.setattr(json_engine.os, "write", write_half_then_fail)
+
+    assert collection.flush() is False
+    assert not first_commit.done()
+    assert collection.stats()["flush_errors"] == 1
+    assert collection.stats()["unflushed"] == 1
+    assert os.path.getsize(tmp_path / "products.journal") == 0
+
+    second_commit = collection.insert(make_product("p2"))
+    assert collection.flush() is True
+    assert first_commit.result(timeout=1) is None
+    assert second_commit.result(timeout=1) is None
+    assert collection.stats()["unflushed"] == 0
+
+    reopened = make_collection(tmp_path)
+    assert [product.id for product in reopened.load()] == ["p1", "p2"]
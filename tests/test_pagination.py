@@ -0,0 +1,64 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from models.models import PageParams, Product
+from utils.pagination import paginate
+
+def make_product(number: int, price: float) -> Product:
+    return Product(id=f"p{number}", name=f"Product {number}", description="", price=price, category="Laptops", quantity=1)
+
+def make_cursor(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+def read_all_pages(products, **params):
+    page = PageParams(limit=3, **params)
+    ids = []
+    while True:
+        page_items, cursor = paginate(list(products), page)
+        ids.extend(product.id for product in page_items)
+        if cursor is None:
+            return ids
+        page = page.model_copy(update={"cursor": cursor})
+
+def test_sorted_cursor_pages_cover_every_item_once_with_ties():
+    products = [make_product(number, price=float(number % 3)) for number in range(10)]
+    ids = read_all_pages(products, sort="price")
+    expected = [product.id for product in sorted(products, key=lambda product: (product.price, product.id))]
+    assert ids == expected
+
+    descending = read_all_pages(products, sort="price", order="desc")
+    assert descending == expected[::-1]
+
+def test_sorted_cursor_is_stable_when_items_are_inserted_before_it():
+    products = [make_product(number, price=float(number)) for number in range(1, 7)]
+    first_page, cursor = paginate(products, PageParams(limit=3, sort="price"))
+    assert [product.id for product in first_page] == ["p1", "p2", "p3"]
+
+    # Новый товар дешевле уже выданных: со смещением он сдвинул бы страницу и p3 выдался бы повторно
+    products.insert(0, make_product(0, price=0.5))
+    second_page, _ = paginate(products, PageParams(limit=3, sort="price", cursor=cursor))
+    assert [product.id for product in second_page] == ["p4", "p5", "p6"]
+
+@pytest.mark.parametrize("sort, key", [
+    ("price", ["x", "p1"]),
+    ("quantity", [1.5, "p1"]),
+    ("name", [1, "p1"]),
+    ("id", ["p1", 7]),
+    ("price", [True, "p1"]),
+])
+def test_cursor_with_mismatched_key_types_is_rejected(sort, key):
+    products = [make_product(number, price=float(number)) for number in range(5)]
+    cursor = make_cursor({"sort": sort, "order": "asc", "key": key})
+    with pytest.raises(HTTPException) as error:
+        paginate(products, PageParams(limit=2, sort=sort, cursor=cursor))
+    assert error.value.status_code == 400
+
+@pytest.mark.parametrize("position", [-1, "2", True, 1.5])
+def test_cursor_with_invalid_position_is_rejected(position):
+    cursor = make_cursor({"sort": None, "order": "asc", "position": position})
+    with pytest.raises(HTTPException) as error:
+        paginate([make_product(1, 1.0)], PageParams(limit=2, cursor=cursor))
+    assert error.value.status_code == 400
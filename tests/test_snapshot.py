@@ -0,0 +1,8 @@
+from database.snapshot import decode_binary, encode_binary
+
+def test_binary_snapshot_round_trips_lone_surrogates():
+    records = [
+        {"id": "p1", "name": "\ud800", "description": "a\x00b\udfff", "price": 1.5, "category": "Laptops", "quantity": 3},
+        {"id": "p2", "name": "plain", "description": "", "price": 2.0, "category": "\udc80", "quantity": 0},
+    ]
+    assert decode_binary(encode_binary(records)) == records
@@ -0,0 +1,59 @@
+import pytest
+
+from database import sqlite_engine
+from database.engine import PageableQuery
+from database.sqlite_engine import SqliteStorageEngine
+from models.models import PageParams, Product, ProductSearch
+from utils.pagination import paginate
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # Маленькие пачки, чтобы страницы собирались из нескольких запросов
+    monkeypatch.setattr(sqlite_engine, "QUERY_BATCH_ROWS", 4)
+    engine = SqliteStorageEngine(str(tmp_path / "techmart.sqlite3"))
+    products = [
+        Product(id=f"p{number}", name=f"Product {number % 5}", description="", price=float(number % 4),
+                category="Laptops" if number % 2 else "Phones", quantity=number % 3)
+        for number in range(1, 24)
+    ]
+    engine.products.apply_batch(products, [])
+    return engine
+
+def read_all_pages(items_factory, limit, **params):
+    page = PageParams(limit=limit, **params)
+    ids = []
+    while True:
+        page_items, cursor = paginate(items_factory(), page)
+        ids.extend(product.id for product in page_items)
+        if cursor is None:
+            return ids
+        page = page.model_copy(update={"cursor": cursor})
+
+@pytest.mark.parametrize("sort", [None, "price", "name", "id", "quantity"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_sql_pages_match_python_pagination(engine, sort, order):
+    listing = engine.products.listing()
+    assert isinstance(listing, PageableQuery)
+    products = engine.products.load()
+    for limit in (1, 5, 50):
+        assert read_all_pages(engine.products.listing, limit, sort=sort, order=order) == \
+            read_all_pages(lambda: list(products), limit, sort=sort, order=order)
+
+def test_search_and_category_are_filtered_in_sql(engine):
+    criteria = ProductSearch(category="lap", min_price=1)
+    expected = [product.id for product in engine.products.load() if product.category == "Laptops" and product.price >= 1]
+    assert [product.id for product in engine.products.search(criteria)] == expected
+    page_items, _ = paginate(engine.products.by_category("PHONES"), PageParams(limit=3, sort="price", order="desc", offset=1))
+    phones = sorted((product for product in engine.products.load() if product.category == "Phones"),
+                    key=lambda product: (product.price, product.id), reverse=True)
+    assert [product.id for product in page_items] == [product.id for product in phones[1:4]]
+
+def test_unlimited_stream_is_lazy_and_survives_writes(engine):
+    stream, cursor = paginate(engine.products.listing(), PageParams(format="ndjson", sort="id"))
+    assert cursor is None
+    first = next(iter(stream))
+    engine.products.insert(Product(id="p99", name="New", description="", price=1.0, category="Phones", quantity=1))
+    rest = [product.id for product in stream]
+    assert first.id == "p1"
+    assert "p99" in rest
+    assert len(rest) == 23
@@ -0,0 +1,255 @@
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него клиенту предлагаются остальные кодировки
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard тоже необязателен
+    zstandard = None
+
+load_dotenv()
+
+# Ответы меньше этого размера отдаются как есть: выигрыш меньше накладных расходов
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+# Уровни сжатия: умеренные, чтобы сжатие большой страницы не добавляло заметной задержки
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+# Сколько байт уже сжатых тел держать, чтобы одинаковые ответы (из кэша ответов
+# или при неизменившихся данных) не сжимались заново
+COMPRESSION_CACHE_MAX_BYTES = int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+# Типы, которые имеет смысл сжимать. text/event-stream сюда не входит: событие должно уйти сразу
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html", "text/csv")
+
+class StreamCompressor:
+    """Потоковый компрессор: chunk() сжимает часть тела и сбрасывает ее клиенту, finish() закрывает поток."""
+
+    def __init__(self, chunk: Callable[[bytes], bytes], finish: Callable[[], bytes]):
+        self.chunk = chunk
+        self.finish = finish
+
+def _gzip_stream() -> StreamCompressor:
+    # wbits=31 - формат gzip (заголовок и CRC), а не "голый" deflate
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return StreamCompressor(
+        lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+def _brotli_stream() -> StreamCompressor:
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    return StreamCompressor(lambda data: compressor.process(data) + compressor.flush(), compressor.finish)
+
+def _zstd_stream() -> StreamCompressor:
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return StreamCompressor(
+        lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        compressor.flush,
+    )
+
+class Codec:
+    def __init__(self, name: str, compress: Callable[[bytes], bytes], stream: Callable[[], StreamCompressor]):
+        self.name = name
+        self.compress = compress
+        self.stream = stream
+
+def available_codecs() -> Dict[str, Codec]:
+    """Кодировки в порядке предпочтения сервера (при равном q у клиента)."""
+    codecs: Dict[str, Codec] = {}
+    if brotli is not None:
+        codecs["br"] = Codec("br", lambda data: brotli.compress(data, quality=BROTLI_QUALITY), _brotli_stream)
+    if zstandard is not None:
+        codecs["zstd"] = Codec("zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress, _zstd_stream)
+    codecs["gzip"] = Codec("gzip", lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0), _gzip_stream)
+    return codecs
+
+def negotiate(accept_encoding: str, codecs: Dict[str, Codec]) -> Optional[Codec]:
+    """Кодировка с наибольшим q из Accept-Encoding; "*" подходит к любой, q=0 запрещает."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        weights[name] = q
+    best: Optional[Codec] = None
+    best_q = 0.0
+    for name, codec in codecs.items():
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+class CompressedBodyCache:
+    """
+    Сжатые тела по (кодировка, хеш исходного тела), LRU в пределах max_bytes.
+    Хеш дешевле сжатия на порядок, поэтому повторная отдача того же тела
+    (из кэша ответов или при неизменившихся данных) сводится к хешированию.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._size = 0
+        self._bodies: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress(self, codec: Codec, body: bytes) -> bytes:
+        key = (codec.name, hashlib.blake2b(body, digest_size=16).digest())
+        with self._lock:
+            self.bytes_in += len(body)
+            compressed = self._bodies.get(key)
+            if compressed is not None:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+                self.bytes_out += len(compressed)
+                return compressed
+            self.misses += 1
+        # Сжатие - вне лока, чтобы большие ответы не ждали друг друга
+        compressed = codec.compress(body)
+        with self._lock:
+            self.bytes_out += len(compressed)
+            if len(compressed) <= self.max_bytes and key not in self._bodies:
+                self._bodies[key] = compressed
+                self._size += len(compressed)
+                while self._size > self.max_bytes:
+                    _, dropped = self._bodies.popitem(last=False)
+                    self._size -= len(dropped)
+        return compressed
+
+    def count_stream(self, bytes_in: int, bytes_out: int):
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._size,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+compressed_bodies = CompressedBodyCache(COMPRESSION_CACHE_MAX_BYTES)
+
+def _is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы кодировкой, выбранной по Accept-Encoding (br, zstd, gzip - что установлено).
+    Обычный ответ сжимается целиком (если он не меньше minimum_size) через кэш сжатых тел;
+    потоковый (например, format=ndjson) - по частям, с досылкой каждой части клиенту.
+    ETag остается прежним: он слабый и одинаков для всех кодировок одного представления.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_BYTES,
+                 cache: CompressedBodyCache = compressed_bodies):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.codecs = available_codecs()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        codec = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        if codec is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(self, codec, send).send)
+
+class _CompressingSender:
+    """Состояние одного ответа: заголовки придерживаются до первой части тела, по ней выбирается режим."""
+
+    def __init__(self, middleware: CompressionMiddleware, codec: Codec, send: Send):
+        self.middleware = middleware
+        self.codec = codec
+        self._send = send
+        self._start: Optional[Message] = None
+        self._mode = "pending"  # pending, passthrough или stream
+        self._stream: Optional[StreamCompressor] = None
+        self._stream_in = 0
+        self._stream_out = 0
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        if self._mode == "passthrough":
+            await self._send(message)
+        elif self._mode == "stream":
+            await self._send_stream_chunk(message)
+        else:
+            await self._first_body(message)
+
+    async def _first_body(self, message: Message):
+        start = self._start
+        headers = MutableHeaders(scope=start)
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if start["status"] < 200 or start["status"] in (204, 304) or not _is_compressible(headers):
+            self._mode = "passthrough"
+            await self._send(start)
+            await self._send(message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        if not more_body:
+            self._mode = "passthrough"
+            if len(body) >= self.middleware.minimum_size:
+                body = self.middleware.cache.compress(self.codec, body)
+                headers["Content-Encoding"] = self.codec.name
+                headers["Content-Length"] = str(len(body))
+            await self._send(start)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        # Потоковый ответ: длина заранее неизвестна, части сжимаются по мере поступления
+        self._mode = "stream"
+        self._stream = self.codec.stream()
+        headers["Content-Encoding"] = self.codec.name
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        await self._send(start)
+        await self._send_stream_chunk(message)
+
+    async def _send_stream_chunk(self, message: Message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        chunks: List[bytes] = [self._stream.chunk(body)] if body else []
+        if not more_body:
+            chunks.append(self._stream.finish())
+        data = b"".join(chunks)
+        self._stream_in += len(body)
+        self._stream_out += len(data)
+        if not more_body:
+            self.middleware.cache.count_stream(self._stream_in, self._stream_out)
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
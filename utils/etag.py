@@ -0,0 +1,25 @@
+from typing import Optional
+from fastapi import Request, Response, status
+
+def make_etag(*parts: str) -> str:
+    """
+    Слабый ETag из версии данных. Слабый, потому что одно и то же представление
+    может уходить клиенту в разном сжатии.
+    """
+    return 'W/"' + ":".join(parts) + '"'
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def is_not_modified(request: Request, etag: Optional[str]) -> bool:
+    """Совпадает ли If-None-Match с текущим ETag (сравнение слабое, как требует RFC 9110)."""
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
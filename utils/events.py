@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from database.db import shared_state
+from database.shared_state import SharedState
+from utils.response_cache import dump_json
+
+load_dotenv()
+
+# Сколько последних событий хранится для продолжения потока после переподключения
+EVENTS_BACKLOG_SIZE = int(os.getenv("EVENTS_BACKLOG_SIZE", 1000))
+# Очередь одного подключения: медленный клиент, отставший сильнее, получает reset
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 256))
+# Интервал комментария-пинга, по которому прокси не закрывают молчащее соединение
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", 15))
+# С несколькими воркерами: как часто воркер с подписчиками дочитывает события остальных
+EVENTS_RELAY_POLL_SECONDS = float(os.getenv("EVENTS_RELAY_POLL_SECONDS", 0.2))
+
+# Событие: (порядковый номер, готовый текст сообщения SSE)
+Event = Tuple[int, str]
+
+class Subscriber:
+    """Одно подключение к потоку: ограниченная очередь в event loop этого подключения."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def push(self, event: Event):
+        # Вызывается только в потоке event loop подписчика
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Писатель не ждет медленного клиента: очередь сбрасывается, клиент получит reset
+            self.overflowed = True
+
+class EventBroker:
+    """
+    Рассылка событий об изменениях подписчикам SSE. publish не блокируется: сообщение
+    сериализуется один раз и кладется в очереди подписчиков без ожидания.
+    Последние события хранятся в кольцевом буфере, чтобы клиент мог продолжить
+    с Last-Event-ID. ID события - эпоха процесса и номер: после рестарта или если
+    клиент отстал дальше буфера, он получает событие reset и перечитывает данные целиком.
+
+    С relay (общее состояние нескольких воркеров) publish только пишет событие в общий журнал,
+    а рассылает его своим подписчикам каждый воркер, дочитав журнал. Номер события - id строки
+    журнала, эпоха - эпоха общего файла, поэтому клиент продолжает поток на любом воркере.
+    """
+
+    def __init__(self, backlog_size: int, queue_size: int, channel: str = "events"):
+        self.queue_size = queue_size
+        self.channel = channel
+        self.epoch = secrets.token_hex(4)
+        self.published = 0
+        self.overflows = 0
+        self._sequence = 0
+        # Номер, до которого включительно события уже недоступны (вытеснены из буфера или были до старта)
+        self._floor = 0
+        self._backlog: Deque[Event] = deque(maxlen=backlog_size)
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self._relay: Optional[SharedState] = None
+        self._poller: Optional[threading.Thread] = None
+
+    def use_relay(self, relay: SharedState):
+        """Рассылать события через общий журнал всем воркерам (до первой публикации)."""
+        with self._lock:
+            self._relay = relay
+            self.epoch = relay.epoch
+            self._sequence = self._floor = relay.last_seen
+        relay.subscribe(self.channel, self._receive, with_id=True)
+
+    def event_id(self, sequence: int) -> str:
+        return f"{self.epoch}-{sequence}"
+
+    def _format(self, sequence: int, event_type: str, data: Dict) -> str:
+        return f"id: {self.event_id(sequence)}\nevent: {event_type}\ndata: {dump_json(data).decode('utf-8')}\n\n"
+
+    def publish(self, event_type: str, data: Dict):
+        if self._relay is not None:
+            self._relay.publish(self.channel, dump_json({"type": event_type, "data": data}).decode("utf-8"))
+            # Свои подписчики получают событие сразу, а не на следующем опросе
+            self._relay.sync()
+            return
+        with self._lock:
+            sequence = self._sequence + 1
+        self._deliver(sequence, event_type, data)
+
+    def _receive(self, entry_id: int, payload: str):
+        message = json.loads(payload)
+        self._deliver(entry_id, message["type"], message["data"])
+
+    def _deliver(self, sequence: int, event_type: str, data: Dict):
+        with self._lock:
+            self._sequence = sequence
+            event = (sequence, self._format(sequence, event_type, data))
+            if len(self._backlog) == self._backlog.maxlen:
+                self._floor = self._backlog[0][0]
+            self._backlog.append(event)
+            self.published += 1
+            subscribers = list(self._subscribers)
+        try:
+            current_loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        for subscriber in subscribers:
+            if subscriber.loop is current_loop:
+                subscriber.push(event)
+            else:
+                subscriber.loop.call_soon_threadsafe(subscriber.push, event)
+
+    def _missed(self, last_event_id: Optional[str]) -> Optional[Tuple[Event, ...]]:
+        """События после last_event_id из буфера; None, если продолжить поток нельзя."""
+        if last_event_id is None:
+            return ()
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        # Номера с relay идут с пропусками (в журнале есть и другие каналы), поэтому
+        # продолжить можно с любого номера между вытесненными событиями и последним
+        if sequence > self._sequence or sequence < self._floor:
+            return None
+        return tuple(event for event in self._backlog if event[0] > sequence)
+
+    def _reset(self) -> str:
+        # Клиент должен перечитать данные; id позволяет продолжить уже с текущего места
+        return f"id: {self.event_id(self._sequence)}\nevent: reset\ndata: {{}}\n\n"
+
+    async def stream(self, last_event_id: Optional[str] = None,
+                     keepalive_seconds: float = EVENTS_KEEPALIVE_SECONDS) -> AsyncIterator[str]:
+        subscriber = Subscriber(asyncio.get_running_loop(), self.queue_size)
+        if self._relay is not None:
+            # Клиент мог прийти с другого воркера, который уже видел более новые события
+            await asyncio.to_thread(self._relay.sync)
+            self._start_poller()
+        with self._lock:
+            # Подписка и снимок буфера под одним локом: ни одно событие не потеряется и не повторится
+            self._subscribers.add(subscriber)
+            missed = self._missed(last_event_id)
+            reset = self._reset() if missed is None else None
+        try:
+            if reset is not None:
+                yield reset
+            for _, message in missed or ():
+                yield message
+            while True:
+                if subscriber.overflowed:
+                    with self._lock:
+                        while not subscriber.queue.empty():
+                            subscriber.queue.get_nowait()
+                        subscriber.overflowed = False
+                        self.overflows += 1
+                        reset = self._reset()
+                    yield reset
+                try:
+                    _, message = await asyncio.wait_for(subscriber.queue.get(), keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield message
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    def _start_poller(self):
+        with self._lock:
+            if self._poller is not None:
+                return
+            self._poller = threading.Thread(target=self._poll_relay, name="events-relay", daemon=True)
+        self._poller.start()
+
+    def _poll_relay(self):
+        # События других воркеров доходят до подписчиков не позже чем через EVENTS_RELAY_POLL_SECONDS
+        while True:
+            time.sleep(EVENTS_RELAY_POLL_SECONDS)
+            if not self._subscribers:
+                continue
+            try:
+                self._relay.sync()
+            except sqlite3.Error:
+                # Файл занят дольше busy_timeout: события дочитаются на следующем опросе
+                continue
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": len(self._subscribers), "published": self.published, "overflows": self.overflows}
+
+product_events = EventBroker(EVENTS_BACKLOG_SIZE, EVENTS_QUEUE_SIZE, channel="product_event")
+if shared_state is not None:
+    product_events.use_relay(shared_state)
+
+# --- События товаров ---
+# Роуты публикуют событие сразу после изменения в памяти, до ожидания записи на диск:
+# так порядок событий совпадает с порядком изменений, как и то, что видят читатели
+def publish_product_change(event_type: str, product: BaseModel):
+    """create или update: товар целиком."""
+    product_events.publish(event_type, product.model_dump(mode="json"))
+
+def publish_stock_change(product: BaseModel):
+    """Изменение остатка (покупка, корзина, правка количества): только id и новое количество."""
+    product_events.publish("stock", {"id": product.id, "quantity": product.quantity})
+
+def publish_product_deleted(product_id: str):
+    product_events.publish("delete", {"id": product_id})
@@ -0,0 +1,151 @@
+import base64
+import heapq
+import json
+import os
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from database.engine import PageableQuery
+from models.models import PageParams, ProductSortField
+
+load_dotenv()
+
+# Максимальный размер страницы; он же используется, если limit не передан в JSON-режиме
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def get_page_params(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
+    sort: Optional[ProductSortField] = Query(None),
+    order: Literal["asc", "desc"] = Query("asc"),
+    format: Literal["json", "ndjson"] = Query("json"),
+) -> PageParams:
+    """Собирает параметры постраничного вывода из query-строки."""
+    return PageParams(limit=limit, offset=offset, cursor=cursor, sort=sort, order=order, format=format)
+
+# --- Курсоры ---
+# Курсор непрозрачен для клиента: это base64 от JSON с позицией, на которой закончилась страница.
+# Без сортировки это число уже выданных записей, с сортировкой - ключ последней записи (значение, id).
+def _encode_cursor(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+# Типы значения сортировки в курсоре: курсор с чужим типом сломал бы сравнение ключей в paginate
+CURSOR_VALUE_TYPES = {"price": (int, float), "quantity": (int,), "name": (str,), "id": (str,)}
+
+def _decode_cursor(cursor: str, page: PageParams) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if payload["sort"] != page.sort or payload["order"] != page.order:
+            raise ValueError("cursor was issued for another ordering")
+        if page.sort is None:
+            position = payload["position"]
+            if isinstance(position, bool) or not isinstance(position, int) or position < 0:
+                raise ValueError("invalid cursor position")
+            return {"position": position}
+        value, item_id = payload["key"]
+        if isinstance(value, bool) or not isinstance(value, CURSOR_VALUE_TYPES[page.sort]) or not isinstance(item_id, str):
+            raise TypeError("cursor key does not match the sort field")
+        return {"key": (value, item_id)}
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+
+def _sort_key(item: BaseModel, field: str) -> Tuple[Any, str]:
+    # id добавляется для однозначного порядка при одинаковых значениях
+    return getattr(item, field), item.id
+
+def paginate(items: Iterable[BaseModel], page: PageParams) -> Tuple[Iterable[BaseModel], Optional[str]]:
+    """
+    Возвращает записи одной страницы и курсор следующей (None, если страница последняя).
+    С сортировкой и limit отбирается только limit записей через кучу, а не сортируется весь список.
+    """
+    limit = page.limit
+    if limit is None and page.format == "json":
+        limit = MAX_PAGE_SIZE
+    payload = _decode_cursor(page.cursor, page) if page.cursor else None
+    if isinstance(items, PageableQuery):
+        return _paginate_query(items, page, limit, payload)
+
+    if page.sort is None:
+        start = (payload["position"] if payload else 0) + page.offset
+        if limit is None:
+            return islice(items, start, None), None
+        selected = list(islice(items, start, start + limit + 1))
+        next_cursor = None
+        if len(selected) > limit:
+            next_cursor = _encode_cursor({"sort": None, "order": page.order, "position": start + limit})
+        return selected[:limit], next_cursor
+
+    descending = page.order == "desc"
+    key = lambda item: _sort_key(item, page.sort)
+    if payload:
+        last_key = payload["key"]
+        if descending:
+            items = (item for item in items if key(item) < last_key)
+        else:
+            items = (item for item in items if key(item) > last_key)
+
+    if limit is None:
+        return sorted(items, key=key, reverse=descending)[page.offset:], None
+
+    take = page.offset + limit + 1
+    selected = heapq.nlargest(take, items, key=key) if descending else heapq.nsmallest(take, items, key=key)
+    page_items = selected[page.offset:page.offset + limit]
+    next_cursor = None
+    if len(selected) > page.offset + limit and page_items:
+        next_cursor = _encode_cursor({"sort": page.sort, "order": page.order, "key": list(key(page_items[-1]))})
+    return page_items, next_cursor
+
+def _paginate_query(query: PageableQuery, page: PageParams, limit: Optional[int],
+                    payload: Optional[dict]) -> Tuple[Iterable[BaseModel], Optional[str]]:
+    """paginate для выборки, которая сортирует и режет страницы сама (например, в SQL)."""
+    if page.sort is None:
+        start = (payload["position"] if payload else 0) + page.offset
+        if limit is None:
+            return query.fetch(None, False, None, start, None), None
+        selected = list(query.fetch(None, False, None, start, limit + 1))
+        next_cursor = None
+        if len(selected) > limit:
+            next_cursor = _encode_cursor({"sort": None, "order": page.order, "position": start + limit})
+        return selected[:limit], next_cursor
+
+    descending = page.order == "desc"
+    after = payload["key"] if payload else None
+    if limit is None:
+        return query.fetch(page.sort, descending, after, page.offset, None), None
+    selected = list(query.fetch(page.sort, descending, after, page.offset, limit + 1))
+    page_items = selected[:limit]
+    next_cursor = None
+    if len(selected) > limit:
+        next_cursor = _encode_cursor({"sort": page.sort, "order": page.order,
+                                      "key": list(_sort_key(page_items[-1], page.sort))})
+    return page_items, next_cursor
+
+def _iter_ndjson(items: Iterable[BaseModel]) -> Iterator[str]:
+    for item in items:
+        yield item.model_dump_json() + "\n"
+
+def paginated_response(
+    items: Iterable[BaseModel], page: PageParams, response: Response
+) -> Union[List[BaseModel], StreamingResponse]:
+    """
+    Применяет пагинацию и сортировку. В режиме ndjson записи сериализуются по одной
+    прямо при отправке, иначе возвращается список для обычного response_model.
+    """
+    page_items, next_cursor = paginate(items, page)
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    if page.format == "ndjson":
+        # Заголовки, выставленные роутом (например, ETag), переносим в потоковый ответ
+        headers = {**response.headers, **headers}
+        return StreamingResponse(_iter_ndjson(page_items), media_type="application/x-ndjson", headers=headers)
+    response.headers.update(headers)
+    return list(page_items)
@@ -0,0 +1,51 @@
+import sqlite3
+from typing import Optional
+
+from limits.storage import Storage
+
+from database.shared_state import SharedState
+
+class SharedStateStorage(Storage):
+    """
+    Хранилище счетчиков limits (и slowapi) в общем файле SharedState: лимит считается
+    один на все воркеры, а не отдельно в каждом процессе. URI: shared-sqlite://путь/к/файлу.
+    """
+
+    STORAGE_SCHEME = ["shared-sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.state = SharedState(uri.split("://", 1)[1])
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return self.state.incr(key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        return self.state.get(key)
+
+    def get_expiry(self, key: str) -> float:
+        return self.state.get_expiry(key)
+
+    def check(self) -> bool:
+        try:
+            with self.state.lock:
+                self.state.connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self.state.reset()
+
+    def clear(self, key: str):
+        self.state.clear(key)
+
+def rate_limit_storage_uri(shared_state_path: str) -> str:
+    """URI хранилища для Limiter: общий файл при нескольких воркерах, иначе память процесса."""
+    if shared_state_path:
+        return f"shared-sqlite://{shared_state_path}"
+    return "memory://"
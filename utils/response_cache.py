@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Response
+from pydantic import BaseModel
+
+from models.models import PageParams
+from utils.pagination import NEXT_CURSOR_HEADER, paginate, paginated_response
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него работает стандартный json
+    orjson = None
+
+load_dotenv()
+
+# Сколько байт готовых ответов держать в памяти
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+def dump_json(data: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            # orjson не умеет целые шире 64 бит (суммы остатков в /api/products/stats)
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def dump_models(items: Iterable[BaseModel]) -> bytes:
+    return dump_json([item.model_dump(mode="json") for item in items])
+
+class ResponseCache:
+    """
+    Готовые тела ответов (байты JSON) по пространству имен, версии данных и варианту ответа
+    (параметры страницы, роль). У пространства хранится только одна версия: как только
+    запись в коллекцию меняет версию, первое же обращение с новой версией выбрасывает
+    все старые варианты. Пространства вытесняются по LRU, когда кэш превышает max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._namespaces: "OrderedDict[str, Tuple[str, Dict[str, Tuple[bytes, Dict[str, str]]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _drop(self, namespace: str):
+        _, variants = self._namespaces.pop(namespace)
+        self._size -= sum(len(body) for body, _ in variants.values())
+
+    def get(self, namespace: str, version: str, variant: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self._lock:
+            entry = self._namespaces.get(namespace)
+            if entry is not None and entry[0] != version:
+                self._drop(namespace)
+                entry = None
+            cached = entry[1].get(variant) if entry is not None else None
+            if cached is None:
+                self.misses += 1
+                return None
+            self._namespaces.move_to_end(namespace)
+            self.hits += 1
+            return cached
+
+    def put(self, namespace: str, version: str, variant: str, body: bytes, headers: Dict[str, str]):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._namespaces.get(namespace)
+            if entry is not None and entry[0] != version:
+                self._drop(namespace)
+                entry = None
+            if entry is None:
+                entry = self._namespaces[namespace] = (version, {})
+            previous = entry[1].get(variant)
+            if previous is not None:
+                self._size -= len(previous[0])
+            entry[1][variant] = (body, headers)
+            self._size += len(body)
+            self._namespaces.move_to_end(namespace)
+            while self._size > self.max_bytes and len(self._namespaces) > 1:
+                self._drop(next(iter(self._namespaces)))
+
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._size, "namespaces": len(self._namespaces)}
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+
+def _json_response(body: bytes, headers: Dict[str, str]) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def cached_json(namespace: str, version: str, variant: str, render: Callable[[], Any],
+                response: Response) -> Response:
+    """
+    Ответ из кэша готовых байт; при промахе render() строит данные (модель, список моделей или dict),
+    и они сериализуются один раз. Заголовки, выставленные роутом (ETag), добавляются к ответу.
+    """
+    cached = response_cache.get(namespace, version, variant)
+    if cached is None:
+        data = render()
+        if isinstance(data, BaseModel):
+            body = dump_json(data.model_dump(mode="json"))
+        elif isinstance(data, list):
+            body = dump_models(data)
+        else:
+            body = dump_json(data)
+        cached = (body, {})
+        response_cache.put(namespace, version, variant, *cached)
+    body, headers = cached
+    return _json_response(body, {**response.headers, **headers})
+
+def cached_page(namespace: str, version: str, load: Callable[[], Iterable[BaseModel]], page: PageParams,
+                response: Response):
+    """
+    paginated_response с кэшем готовой страницы: данные загружаются только при промахе.
+    Потоковый ndjson не кэшируется, он и так не собирает ответ целиком.
+    """
+    if page.format != "json":
+        return paginated_response(load(), page, response)
+    variant = page.model_dump_json()
+    cached = response_cache.get(namespace, version, variant)
+    if cached is None:
+        page_items, next_cursor = paginate(load(), page)
+        cached = (dump_models(page_items), {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {})
+        response_cache.put(namespace, version, variant, *cached)
+    body, headers = cached
+    return _json_response(body, {**response.headers, **headers})